@@ -2,14 +2,42 @@ from flask import Flask, render_template, request, redirect, url_for, session, f
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+import sqlalchemy as sa
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
-from app import routes, models
+from app.database import apply_sqlite_pragmas
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        sa.event.listen(db.engine, 'connect', apply_sqlite_pragmas)
+
+from app.cache import shared_backend
+# Where caches of Plex-derived data live when every worker process should share them
+# (CACHE_BACKEND); None keeps each cache in its own process
+cache_backend = shared_backend(app.config)
+
+from app.connections import PlexConnectionPool
+plex_pool = PlexConnectionPool(max_size=app.config['PLEX_POOL_MAX_SIZE'],
+                               idle_timeout=app.config['PLEX_POOL_IDLE_TIMEOUT'])
+
+from app.live_sessions import SessionCollector
+session_collector = SessionCollector(interval=app.config['NOW_PLAYING_POLL_INTERVAL'],
+                                     linger=app.config['NOW_PLAYING_POLLER_LINGER'],
+                                     backend=cache_backend)
+
+from app.jobs import Scheduler, default_jobs, cache_warm_jobs
+# Started by the first request when SCHEDULER_MODE is 'thread'; worker.py runs its own
+scheduler = Scheduler(default_jobs(), workers=app.config['SCHEDULER_WORKERS'],
+                      per_server_limit=app.config['SCHEDULER_PER_SERVER_LIMIT'],
+                      jitter=app.config['SCHEDULER_JITTER'])
+# Started by the first request in every web worker process unless SCHEDULER_MODE is 'off'
+cache_warmer = Scheduler(cache_warm_jobs(), workers=1, jitter=app.config['SCHEDULER_JITTER'])
+
+from app import routes, models, users
 
 @app.context_processor
 def inject_user_model():
-    return dict(User=models.User)
\ No newline at end of file
+    return dict(User=models.User, current_user=users.current_user)
\ No newline at end of file
@@ -0,0 +1,238 @@
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Part of every key; bump it when the shape of a cached value changes, so
+# processes running new code never unpickle what older ones stored
+KEY_VERSION = 1
+
+
+class MemoryBackend:
+    """In-process LRU store, private to one worker process. The default backend."""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, stored_at, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(value, stored_at) for an unexpired entry, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, stored_at
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (value, now, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, prefix=''):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteBackend:
+    """
+    Store in a SQLite file that every worker process on the host opens, so a
+    value fetched from Plex by one worker is reused by the others and survives
+    restarts. Values are pickled (protocol 5); WAL mode lets readers proceed
+    while another process writes.
+
+    Past `max_entries`, the least recently stored entries are dropped; expired
+    ones are purged every PURGE_EVERY writes.
+    """
+
+    PURGE_EVERY = 256
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL'
+            ') WITHOUT ROWID')
+
+    def _connection(self):
+        # One connection per thread, and a new one after a fork (gunicorn --preload):
+        # a connection must not be shared between processes
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value, stored_at FROM cache_entries WHERE key = ? AND expires_at > ?',
+            (key, time.time())).fetchone()
+        return None if row is None else (pickle.loads(row[0]), row[1])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)',
+                           (key, pickle.dumps(value, protocol=5), now, now + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            connection.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                ' SELECT key FROM cache_entries ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,))
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self, prefix=''):
+        # Keys with the prefix sort between it and it + U+10FFFF
+        self._connection().execute('DELETE FROM cache_entries WHERE key >= ? AND key < ?',
+                                   (prefix, prefix + '\U0010ffff'))
+
+
+def shared_backend(config):
+    """
+    The CACHE_BACKEND store that caches of Plex-derived data share across worker
+    processes, or None for 'memory', which keeps every cache in-process.
+    """
+    if config['CACHE_BACKEND'] == 'memory':
+        return None
+    if config['CACHE_BACKEND'] == 'sqlite':
+        return SQLiteBackend(config['CACHE_PATH'], max_entries=config['CACHE_MAX_ENTRIES'])
+    raise ValueError(f"Unknown CACHE_BACKEND '{config['CACHE_BACKEND']}'")
+
+
+def _versioned(namespace, key):
+    return f'{KEY_VERSION}:{namespace}:{key!r}'
+
+
+class TTLCache:
+    """
+    Small thread-safe cache whose entries expire `ttl` seconds after being set.
+    Kept in a private MemoryBackend of `max_size` entries unless a shared
+    `backend` is given; `namespace` keeps its keys apart from other caches'.
+    """
+
+    def __init__(self, ttl, max_size=256, namespace='default', backend=None):
+        self.ttl = ttl
+        self.namespace = namespace
+        self.backend = backend or MemoryBackend(max_size)
+
+    def get(self, key, default=None):
+        entry = self.backend.get(_versioned(self.namespace, key))
+        return default if entry is None else entry[0]
+
+    def set(self, key, value):
+        self.backend.set(_versioned(self.namespace, key), value, self.ttl)
+
+    def invalidate(self, key):
+        self.backend.delete(_versioned(self.namespace, key))
+
+    def clear(self):
+        self.backend.clear(f'{KEY_VERSION}:{self.namespace}:')
+
+
+class SWRCache:
+    """
+    Thread-safe cache for slow upstream fetches (Plex calls), with
+    stale-while-revalidate and single-flight loading. Stored like TTLCache's:
+    a private MemoryBackend, or a shared `backend` under `namespace`.
+
+    get(key, load) returns a value younger than `ttl` straight from the cache.
+    One up to `ttl + stale_ttl` old is returned just as fast while a background
+    thread calls load() to refresh it. Anything older, or missing, is loaded in
+    the calling thread. Concurrent callers for the same key share one load()
+    either way, so ten requests at once cost one upstream fetch (per process;
+    with a shared backend, other processes pick up whatever one has stored).
+
+    Values for which `cacheable(value)` is false are handed to the waiting
+    callers but not stored; a failed refresh keeps serving the stale value.
+    """
+
+    def __init__(self, ttl, stale_ttl, max_size=256, cacheable=None, workers=2, namespace='default',
+                 backend=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cacheable = cacheable
+        self.namespace = namespace
+        self.backend = backend or MemoryBackend(max_size)
+        self._loading = {}  # key -> Future of the load in flight
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._executor = None
+
+    def get(self, key, load):
+        # Entries are stored for ttl + stale_ttl, so anything returned is servable
+        entry = self.backend.get(_versioned(self.namespace, key))
+        with self._lock:
+            if entry is not None:
+                value, stored_at = entry
+                if time.time() - stored_at >= self.ttl and key not in self._loading:
+                    future = self._loading[key] = Future()
+                    self._refresher().submit(self._load, key, load, future, True)
+                return value
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._loading[key] = Future()
+        if leader:
+            self._load(key, load, future)
+        return future.result()
+
+    def _refresher(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='swr-refresh')
+        return self._executor
+
+    def _load(self, key, load, future, background=False):
+        try:
+            value = load()
+        except Exception as e:
+            with self._lock:
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+            if background:
+                # Nobody waits on a background refresh, so its failure is only logged
+                print(f"Error refreshing cached value for {key!r}: {e}", file=sys.stderr)
+            future.set_exception(e)
+            return
+        with self._lock:
+            # Unless invalidate() dropped this load while it ran, e.g. after a credentials change
+            if self._loading.get(key) is future:
+                del self._loading[key]
+                if self.cacheable is None or self.cacheable(value):
+                    self.backend.set(_versioned(self.namespace, key), value, self.ttl + self.stale_ttl)
+        future.set_result(value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._loading.pop(key, None)
+        self.backend.delete(_versioned(self.namespace, key))
+
+    def clear(self):
+        with self._lock:
+            self._loading.clear()
+        self.backend.clear(f'{KEY_VERSION}:{self.namespace}:')
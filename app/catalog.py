@@ -0,0 +1,104 @@
+import sys
+import threading
+import sqlalchemy as sa
+from app import db, library
+from app.models import UserPlexLibrary, UserMediaMetadata, UserMediaGenre
+
+
+class MediaRecord:
+    """
+    One movie or show in a Catalog. Slotted, so there's no per-item __dict__;
+    genres are a bitmask over Catalog.genres instead of a list of strings.
+    """
+
+    __slots__ = ('id', 'title', 'year', 'media_type', 'content_rating', 'view_count', 'genre_mask')
+
+    def __init__(self, media_id, title, year, media_type, content_rating, view_count, genre_mask=0):
+        self.id = media_id
+        self.title = title
+        self.year = year
+        self.media_type = media_type
+        self.content_rating = content_rating
+        self.view_count = view_count
+        self.genre_mask = genre_mask
+
+    def __repr__(self):
+        return '<MediaRecord {}>'.format(self.title)
+
+
+class Catalog:
+    """
+    Compact in-memory copy of one user's library snapshot, built once per
+    snapshot version and shared by the facet counts, the title typeahead and
+    anything else that wants to scan the library without going to the database.
+
+    Repeated strings (media types, content ratings, genres) are interned, so a
+    50k item catalog holds one copy of each; the bulk of its few MB is titles.
+    """
+
+    def __init__(self, version, rows, genre_rows):
+        self.version = version
+        self.records = [MediaRecord(media_id, title, year, sys.intern(media_type),
+                                    sys.intern(rating) if rating else None, view_count or 0)
+                        for media_id, title, year, media_type, rating, view_count in rows]
+        self.genres = sorted({sys.intern(genre) for _, genre in genre_rows})
+        self.genre_bits = {genre: 1 << bit for bit, genre in enumerate(self.genres)}
+        positions = {record.id: position for position, record in enumerate(self.records)}
+        for media_id, genre in genre_rows:
+            position = positions.get(media_id)
+            if position is not None:
+                self.records[position].genre_mask |= self.genre_bits[genre]
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def genre_tags(self, record):
+        return [genre for genre, bit in self.genre_bits.items() if record.genre_mask & bit]
+
+    def derived(self, name, build):
+        """
+        An index built from this catalog (facet bitmaps, title typeahead), made
+        on first use and dropped along with the catalog when the snapshot changes.
+        """
+        with self._lock:
+            index = self._derived.get(name)
+        if index is None:
+            index = build(self)
+            with self._lock:
+                index = self._derived.setdefault(name, index)
+        return index
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def _build(user, version):
+    user_libraries = sa.select(UserPlexLibrary.id).where(*library.snapshot_filter(user))
+    rows = db.session.execute(
+        sa.select(UserMediaMetadata.id, UserMediaMetadata.title, UserMediaMetadata.year,
+                  UserMediaMetadata.media_type, UserMediaMetadata.content_rating,
+                  UserMediaMetadata.view_count)
+        .where(UserMediaMetadata.library_id.in_(user_libraries))
+        .order_by(UserMediaMetadata.id)).all()
+    genre_rows = db.session.execute(
+        sa.select(UserMediaGenre.media_id, UserMediaGenre.genre)
+        .join(UserMediaMetadata)
+        .where(UserMediaMetadata.library_id.in_(user_libraries))).all()
+    return Catalog(version, rows, genre_rows)
+
+
+def get_catalog(user):
+    """The user's Catalog, rebuilt only when a sync has changed their snapshot."""
+    version = library.snapshot_version(user)
+    with _catalogs_lock:
+        catalog = _catalogs.get(user.id)
+    if catalog is None or catalog.version != version:
+        catalog = _build(user, version)
+        with _catalogs_lock:
+            _catalogs[user.id] = catalog
+    return catalog
+
+
+def invalidate(user_id):
+    with _catalogs_lock:
+        _catalogs.pop(user_id, None)
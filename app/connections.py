@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from plexapi.server import PlexServer
+
+
+class PlexConnectionPool:
+    """
+    Process-wide cache of connected PlexServer objects, keyed by
+    (user id, baseurl, token), so requests reuse the server handshake and
+    the underlying requests.Session (HTTP keep-alive) instead of reconnecting.
+
+    Evicted servers are only dropped from the pool, never closed, because a
+    request that already holds one may still be using its session.
+    """
+
+    def __init__(self, max_size=32, idle_timeout=300):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()  # key -> (PlexServer, last_used)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connect_seconds = 0.0
+
+    def get(self, user):
+        key = (user.id, user.plex_baseurl, user.plex_token)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Connect outside the lock so one slow server doesn't block every other user
+        started = time.monotonic()
+        plex = PlexServer(user.plex_baseurl, user.plex_token)
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self.connect_seconds += elapsed
+            # Credentials may have changed while we were connecting
+            self._drop_user(user.id, keep=key)
+            self._entries[key] = (plex, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return plex
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._drop_user(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_connect = self.connect_seconds / self.misses if self.misses else 0.0
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_connect_ms': avg_connect * 1000,
+                # Every hit skips one connect, so this is the latency the pool has saved
+                'saved_ms': self.hits * avg_connect * 1000,
+            }
+
+    def _evict_idle(self, now):
+        # Entries are kept in LRU order, so idle ones are at the front
+        while self._entries:
+            key, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_timeout:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def _drop_user(self, user_id, keep=None):
+        for key in [k for k in self._entries if k[0] == user_id and k != keep]:
+            del self._entries[key]
+            self.evictions += 1
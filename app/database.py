@@ -0,0 +1,13 @@
+from app import app
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    'connect' listener for the SQLite engine. Every worker process and thread
+    opens its own connections, so the pragmas are set on each one as it's made.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.close()
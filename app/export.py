@@ -0,0 +1,99 @@
+import json
+from datetime import datetime
+import sqlalchemy as sa
+from app import db, library
+from app.models import UserPlexLibrary, UserMediaMetadata, UserMediaGenre
+
+# Export field -> snapshot column, in output order. The names match /content's JSON;
+# genre_tags has no column of its own and is filled in per batch.
+FIELDS = {
+    'id': UserMediaMetadata.id,
+    'type': UserMediaMetadata.media_type,
+    'title': UserMediaMetadata.title,
+    'year': UserMediaMetadata.year,
+    'summary': UserMediaMetadata.description,
+    'genre_tags': None,
+    'content_rating': UserMediaMetadata.content_rating,
+    'actors': UserMediaMetadata.actors,
+    'view_count': UserMediaMetadata.view_count,
+    'added_at': UserMediaMetadata.added_at,
+    'updated_at': UserMediaMetadata.updated_at,
+}
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def parse_fields(value):
+    """
+    The fields named in a comma separated ?fields= value, in FIELDS order; all
+    of them when it's empty. Raises ValueError for names that aren't exported.
+    """
+    if not value:
+        return list(FIELDS)
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown export field(s): {', '.join(sorted(unknown))}")
+    return [name for name in FIELDS if name in requested]
+
+
+def batches(user, fields, batch_size=1000):
+    """
+    Yields the user's snapshot as lists of up to `batch_size` dicts of `fields`,
+    in id order. Each batch is one keyset query on plain columns (plus one for
+    its genres), so memory stays flat however many items are exported.
+    """
+    columns = [FIELDS[name] for name in fields if FIELDS[name] is not None]
+    user_libraries = sa.select(UserPlexLibrary.id).where(*library.snapshot_filter(user))
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            sa.select(UserMediaMetadata.id, *columns)
+            .where(UserMediaMetadata.library_id.in_(user_libraries), UserMediaMetadata.id > last_id)
+            .order_by(UserMediaMetadata.id)
+            .limit(batch_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        genres = {}
+        if 'genre_tags' in fields:
+            genre_rows = db.session.execute(
+                sa.select(UserMediaGenre.media_id, UserMediaGenre.genre)
+                .where(UserMediaGenre.media_id.in_([row[0] for row in rows]))
+                .order_by(UserMediaGenre.genre))
+            for media_id, genre in genre_rows:
+                genres.setdefault(media_id, []).append(genre)
+        batch = []
+        for media_id, *values in rows:
+            values = iter(values)
+            batch.append({name: genres.get(media_id, []) if FIELDS[name] is None else next(values)
+                          for name in fields})
+        yield batch
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _dumps(record):
+    return json.dumps(record, default=_default)
+
+
+def ndjson(batches):
+    """One JSON object per line; a chunk of the response per batch."""
+    for batch in batches:
+        yield ''.join(_dumps(record) + '\n' for record in batch)
+
+
+def json_array(batches):
+    """A single JSON array, sent a batch at a time."""
+    separator = '['
+    for batch in batches:
+        yield separator + ','.join(_dumps(record) for record in batch)
+        separator = ','
+    yield ']\n' if separator == ',' else '[]\n'
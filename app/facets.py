@@ -0,0 +1,76 @@
+from app.catalog import get_catalog
+
+
+class FacetIndex:
+    """
+    Genre, year and content rating -> item bitmaps for one user's snapshot.
+
+    Each item gets a bit position; a facet value maps to a Python int with the
+    bits of its items set, so combining filters is a bitwise AND and counting
+    is int.bit_count() instead of a scan over the library.
+    """
+
+    FACETS = ('genre', 'year', 'rating')
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        self.size = len(catalog.records)
+        members = {facet: {} for facet in self.FACETS}
+        genre_members = [[] for _ in catalog.genres]
+        # Bit positions are positions in catalog.records
+        for position, record in enumerate(catalog.records):
+            if record.year:
+                members['year'].setdefault(record.year, []).append(position)
+            if record.content_rating:
+                members['rating'].setdefault(record.content_rating, []).append(position)
+            mask = record.genre_mask
+            while mask:
+                lowest = mask & -mask
+                genre_members[lowest.bit_length() - 1].append(position)
+                mask ^= lowest
+        members['genre'] = {genre: bits for genre, bits in zip(catalog.genres, genre_members) if bits}
+        self.bitmaps = {facet: {value: self._bitmap(bits) for value, bits in values.items()}
+                        for facet, values in members.items()}
+        self.all = (1 << self.size) - 1
+
+    def _bitmap(self, bits):
+        # Set bits in a bytearray and convert once; OR-ing into a growing int is quadratic
+        buffer = bytearray((self.size + 7) // 8)
+        for bit in bits:
+            buffer[bit >> 3] |= 1 << (bit & 7)
+        return int.from_bytes(buffer, 'little')
+
+    def values(self, facet):
+        return sorted(self.bitmaps[facet])
+
+    def match(self, genre=None, year=None, rating=None):
+        """Bitmap of the items matching every given filter."""
+        selected = self.all
+        for facet, value in (('genre', genre), ('year', year), ('rating', rating)):
+            if value:
+                if facet == 'year':
+                    value = int(value) if str(value).isdigit() else None
+                selected &= self.bitmaps[facet].get(value, 0)
+        return selected
+
+    def count(self, **filters):
+        return self.match(**filters).bit_count()
+
+    def counts(self, **filters):
+        """
+        Per-value counts for every facet, narrowed by the other facets' filters,
+        so each dropdown shows how many items picking that value would leave.
+        """
+        result = {}
+        for facet in self.FACETS:
+            others = {name: value for name, value in filters.items() if name != facet}
+            selected = self.match(**others)
+            result[facet] = [{'value': value, 'count': (bitmap & selected).bit_count()}
+                             for value, bitmap in sorted(self.bitmaps[facet].items())]
+        result['total'] = self.match(**filters).bit_count()
+        return result
+
+
+def get_facets(user):
+    """The user's FacetIndex, rebuilt only when a sync has changed their snapshot."""
+    return get_catalog(user).derived('facets', FacetIndex)
@@ -0,0 +1,189 @@
+import sys
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from plexapi import utils
+from app import app, db, cache_backend, plex_fetch
+from app.cache import TTLCache
+from app.models import WatchHistory, WatchHistoryRollup
+
+HISTORY_PATH = '/status/sessions/history/all'
+
+# Rollup granularities kept for every ingested play
+BUCKETS = ('day', 'week')
+
+# Users whose history was ingested within the last WATCH_HISTORY_SYNC_INTERVAL seconds
+_recently_ingested = TTLCache(ttl=app.config['WATCH_HISTORY_SYNC_INTERVAL'], namespace='history_ingested',
+                              backend=cache_backend)
+
+
+def period_start(bucket, day):
+    """First day of the day/week bucket `day` falls in; weeks start on Monday."""
+    return day if bucket == 'day' else day - timedelta(days=day.weekday())
+
+
+def _attributes(element):
+    return dict(element.attrib)
+
+
+def fetch_history(plex, since=None):
+    """
+    Pages of the server's watch history entries (XML attributes), oldest first.
+    With `since`, only plays from that second on are fetched. The listing is
+    streamed page by page like a library sync's (see app/plex_fetch.py), so a
+    first import of years of history never sits in memory at once.
+    """
+    args = {'sort': 'viewedAt:asc'}
+    if since is not None:
+        # viewedAt>> is strictly after; step back a second so plays sharing the
+        # newest stored timestamp aren't skipped (they're deduplicated on insert)
+        args['viewedAt>>'] = int(since.replace(tzinfo=timezone.utc).timestamp()) - 1
+    for _, entries in plex_fetch.stream_containers(plex, [HISTORY_PATH + utils.joinArgs(args)],
+                                                   page_size=app.config['PLEX_FETCH_PAGE_SIZE'],
+                                                   workers=app.config['PLEX_FETCH_WORKERS'],
+                                                   parse=_attributes):
+        yield entries
+
+
+def _entry_title(entry):
+    # Episodes are filed under their show through the grandparentTitle each entry carries
+    if entry.get('type') == 'episode':
+        return entry.get('grandparentTitle')
+    return entry.get('title')
+
+
+def ingest_history(user, plex):
+    """
+    Appends the plays newer than the user's latest stored one to WatchHistory
+    and adds them to the daily and weekly rollups. Returns how many were added.
+
+    Each page of history is written and committed as it arrives, so if a pull
+    fails part way, the next one carries on from the last stored play.
+    """
+    latest = db.session.scalar(
+        sa.select(sa.func.max(WatchHistory.viewed_at))
+        .where(WatchHistory.user_id == user.id, WatchHistory.plex_server_url == user.plex_baseurl))
+    boundary = set()
+    if latest is not None:
+        boundary.update(db.session.scalars(
+            sa.select(WatchHistory.history_key)
+            .where(WatchHistory.user_id == user.id,
+                   WatchHistory.plex_server_url == user.plex_baseurl,
+                   WatchHistory.viewed_at >= latest - timedelta(seconds=1))))
+
+    added = 0
+    seen = boundary
+    for entries in fetch_history(plex, latest):
+        rows, plays, page_keys = [], Counter(), set()
+        for entry in entries:
+            title = _entry_title(entry)
+            if not title or not entry.get('viewedAt'):
+                continue
+            key = entry.get('historyKey') or f"{entry.get('ratingKey')}/{entry.get('viewedAt')}/{entry.get('accountID')}"
+            if key in seen or key in page_keys:
+                continue
+            page_keys.add(key)
+            viewed_at = datetime.fromtimestamp(int(entry['viewedAt']), timezone.utc).replace(tzinfo=None)
+            rows.append({'user_id': user.id, 'plex_server_url': user.plex_baseurl, 'history_key': key,
+                         'rating_key': entry.get('ratingKey'), 'title': title,
+                         'media_type': entry.get('type'), 'account_id': entry.get('accountID'),
+                         'viewed_at': viewed_at})
+            for bucket in BUCKETS:
+                plays[(bucket, period_start(bucket, viewed_at.date()), title)] += 1
+        if rows:
+            # One executemany per page rather than an ORM object per play
+            db.session.execute(sa.insert(WatchHistory), rows)
+            _apply_rollups(user, plays)
+            db.session.commit()
+            added += len(rows)
+        # A play can only show up twice on neighbouring pages (if the listing
+        # shifts while it's paged through), so only the last page's keys are kept
+        seen = boundary | page_keys
+
+    # Whether it ran from a request or the scheduler, the next pull isn't due for an interval
+    _recently_ingested.set(user.id, True)
+    return added
+
+
+def _apply_rollups(user, plays):
+    # New plays land in the latest periods, so only those rollup rows are loaded
+    earliest = min(period for _, period, _ in plays)
+    rollups = {(row.bucket, row.period_start, row.title): row for row in WatchHistoryRollup.query.filter(
+        WatchHistoryRollup.user_id == user.id, WatchHistoryRollup.period_start >= earliest)}
+    for (bucket, period, title), count in plays.items():
+        row = rollups.get((bucket, period, title))
+        if row is None:
+            row = WatchHistoryRollup(user_id=user.id, bucket=bucket, period_start=period, title=title,
+                                     plays=0)
+            db.session.add(row)
+        row.plays += count
+
+
+def ensure_history(user, connect):
+    """
+    Ingests new plays if the user's history hasn't been pulled in the last
+    WATCH_HISTORY_SYNC_INTERVAL seconds. `connect()` is only called then, for the
+    PlexServer (or None); without it, or if the pull fails, what's stored is served.
+    """
+    if _recently_ingested.get(user.id):
+        return
+    plex = connect()
+    if plex is None:
+        return
+    try:
+        ingest_history(user, plex)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error ingesting watch history for user {user.id}: {e}", file=sys.stderr)
+
+
+def clear_history(user_id):
+    """Deletes the user's stored plays and rollups, e.g. when they point at another server."""
+    db.session.execute(sa.delete(WatchHistoryRollup).where(WatchHistoryRollup.user_id == user_id))
+    db.session.execute(sa.delete(WatchHistory).where(WatchHistory.user_id == user_id))
+    _recently_ingested.invalidate(user_id)
+
+
+def history_version(user):
+    """Short string that changes whenever plays are added to or cleared from the user's history."""
+    count, last_id = db.session.execute(
+        sa.select(sa.func.count(), sa.func.max(WatchHistory.id)).where(WatchHistory.user_id == user.id)).one()
+    return f'{count}.{last_id or 0}'
+
+
+def _range_filter(bucket, start, end):
+    conditions = [WatchHistoryRollup.bucket == bucket]
+    if start is not None:
+        conditions.append(WatchHistoryRollup.period_start >= period_start(bucket, start))
+    if end is not None:
+        conditions.append(WatchHistoryRollup.period_start <= end)
+    return conditions
+
+
+def play_counts(user, start=None, end=None, limit=20):
+    """(title, plays) for the most played titles between the start and end dates, inclusive."""
+    plays = sa.func.sum(WatchHistoryRollup.plays)
+    return db.session.execute(
+        sa.select(WatchHistoryRollup.title, plays)
+        .where(WatchHistoryRollup.user_id == user.id, *_range_filter('day', start, end))
+        .group_by(WatchHistoryRollup.title)
+        .order_by(plays.desc(), WatchHistoryRollup.title)
+        .limit(limit)).all()
+
+
+def play_series(user, bucket, start=None, end=None, limit=20):
+    """
+    Plays per day or week between the start and end dates for the `limit` most
+    played titles in that range, as {title: [(period_start, plays), ...]}.
+    Weeks overlapping the range count in full; periods without plays are left out.
+    """
+    titles = [title for title, _ in play_counts(user, start, end, limit)]
+    series = {title: [] for title in titles}
+    rows = db.session.execute(
+        sa.select(WatchHistoryRollup.title, WatchHistoryRollup.period_start, WatchHistoryRollup.plays)
+        .where(WatchHistoryRollup.user_id == user.id, WatchHistoryRollup.title.in_(titles),
+               *_range_filter(bucket, start, end))
+        .order_by(WatchHistoryRollup.period_start))
+    for title, period, plays in rows:
+        series[title].append((period, plays))
+    return series
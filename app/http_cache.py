@@ -0,0 +1,90 @@
+import functools
+import gzip
+import hashlib
+from flask import request, session, make_response
+from app import app
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the brotli package is installed
+    brotli = None
+
+# Bodies are compressed only in these types and from this size on
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+
+
+def _etag(version):
+    # The user and query string are part of the tag: the same snapshot version
+    # gives different bodies for another user or another ?genre=/?bucket=
+    key = f"{request.endpoint}|{session.get('user_id')}|{version}|{request.query_string.decode()}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def _not_modified(etag, modified):
+    # If-None-Match takes precedence; If-Modified-Since is only for clients that don't send it
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return (modified is not None and request.if_modified_since is not None
+            and modified.replace(microsecond=0) <= request.if_modified_since)
+
+
+def _encode(response):
+    """gzip/br-compresses a large enough JSON body the client accepts compressed."""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < app.config['HTTP_COMPRESS_MIN_SIZE']:
+        return response
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def http_cache(version, max_age=0, last_modified=None):
+    """
+    Decorator for JSON endpoints backed by data with a cheap version: a snapshot
+    version, a history watermark, a session poller's counter.
+
+    `version()` runs first, with the request context; its result becomes a weak
+    ETag, so a matching If-None-Match is answered with a 304 without calling
+    the view at all. It may return None to skip caching for a request (say,
+    the HTML path of a route that also serves JSON). If `last_modified()` is
+    given, it returns an aware datetime (or None) that is sent as Last-Modified
+    and checked against If-Modified-Since in the same way. Responses get
+    `Cache-Control: private` and `max-age` seconds of freshness (or no-cache
+    when 0, meaning always revalidate), and large bodies are compressed.
+    Error responses are passed through untouched.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(*args, **kwargs):
+            current = version()
+            if current is None:
+                return _encode(make_response(view(*args, **kwargs)))
+            etag = _etag(current)
+            modified = last_modified() if last_modified is not None else None
+            if _not_modified(etag, modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # Weak, since the same tag covers the gzip, br and identity bodies
+            response.set_etag(etag, weak=True)
+            if modified is not None:
+                response.last_modified = modified
+            response.cache_control.private = True
+            if max_age:
+                response.cache_control.max_age = max_age
+            else:
+                response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return _encode(response)
+        return wrapped_view
+    return decorator
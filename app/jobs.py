@@ -0,0 +1,216 @@
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db, plex_pool, library, history, facets, suggest
+from app.live_sessions import server_key
+from app.models import User, JobRun
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where every process runs its own scheduler
+    fcntl = None
+
+# Seconds between checks for due jobs
+TICK = 5
+# How long JobRun rows are kept, and how often old ones are pruned
+JOB_RUN_RETENTION = timedelta(days=7)
+PRUNE_INTERVAL = 3600
+# Seconds between a process's attempts to take over the scheduler lock
+LOCK_RETRY = 60
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def warm_caches(user):
+    """
+    Builds the user's in-memory catalog and indexes ahead of their next page
+    view. They're read from the stored library, so Plex isn't contacted.
+    """
+    facets.get_facets(user)
+    suggest.get_title_index(user)
+
+
+class Job:
+    """
+    A per-user job. With `needs_plex`, it's run as run(user, plex) and takes one
+    of its server's slots; otherwise as run(user), without connecting to Plex.
+    """
+
+    def __init__(self, name, interval, run, needs_plex=True):
+        self.name = name
+        self.interval = interval
+        self.run = run
+        self.needs_plex = needs_plex
+
+
+def default_jobs():
+    """The per-user jobs that pull from Plex; one process per host runs them."""
+    return [Job('library_sync', app.config['LIBRARY_SYNC_INTERVAL'], library.sync_library),
+            Job('history_ingest', app.config['WATCH_HISTORY_SYNC_INTERVAL'], history.ingest_history)]
+
+
+def cache_warm_jobs():
+    """
+    The cache warm-up job. The caches it fills are per process, so every web
+    worker process runs its own, unlike default_jobs().
+    """
+    return [Job('cache_warm', app.config['CACHE_WARM_INTERVAL'], warm_caches, needs_plex=False)]
+
+
+class Scheduler:
+    """
+    Runs every job for every user with Plex credentials on the job's interval,
+    shifted by a random jitter, so Plex work happens in the background rather
+    than in the first request to need it.
+
+    At most `per_server_limit` jobs talk to one Plex server at a time; a due job
+    whose server is busy waits for the next tick. Each run is recorded as a JobRun.
+    """
+
+    def __init__(self, jobs, workers=4, per_server_limit=1, jitter=0.1):
+        self.jobs = jobs
+        self.workers = workers
+        self.per_server_limit = per_server_limit
+        self.jitter = jitter
+        self.started = False
+        self._next_run = {}  # (job name, user id) -> time.monotonic() it's due
+        self._running = set()  # (job name, user id) queued or running
+        self._server_slots = {}  # server_key -> BoundedSemaphore
+        self._lock = threading.Lock()
+        self._last_prune = float('-inf')
+        self._lock_file = None
+        self._next_lock_attempt = float('-inf')
+
+    def start(self, lock_path=None):
+        """
+        Runs the scheduler on a daemon thread inside this process. With
+        `lock_path`, only the one process on the host holding that file's lock
+        runs it, so web worker processes don't each run every job; the others
+        try again every LOCK_RETRY seconds and take over if it exits.
+        """
+        with self._lock:
+            if self.started:
+                return
+            if lock_path is not None and not self._take_lock(lock_path):
+                return
+            self.started = True
+        threading.Thread(target=self.run_forever, daemon=True, name='scheduler').start()
+
+    def _take_lock(self, lock_path):
+        # Callers hold self._lock
+        if fcntl is None:
+            return True
+        now = time.monotonic()
+        if now < self._next_lock_attempt:
+            return False
+        self._next_lock_attempt = now + LOCK_RETRY
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Kept open, and so locked, until this process exits
+        lock_file.truncate(0)
+        lock_file.write(f'{os.getpid()}\n')
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def run_forever(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='scheduler-job') as executor:
+            while True:
+                try:
+                    with app.app_context():
+                        self.tick(executor)
+                except Exception as e:
+                    print(f"Error scheduling background jobs: {e}", file=sys.stderr)
+                time.sleep(TICK)
+
+    def _delay(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def tick(self, executor):
+        """Submits every due job whose Plex server, if it needs one, has a free slot."""
+        users = db.session.execute(
+            sa.select(User.id, User.plex_baseurl)
+            .where(User.plex_baseurl.is_not(None), User.plex_token.is_not(None))).all()
+        now = time.monotonic()
+        with self._lock:
+            active = {user_id for user_id, _ in users}
+            for key in [key for key in self._next_run if key[1] not in active]:
+                del self._next_run[key]
+            for user_id, baseurl in users:
+                for job in self.jobs:
+                    key = (job.name, user_id)
+                    # First runs are spread over the jitter window rather than all at start-up
+                    due = self._next_run.setdefault(
+                        key, now + random.uniform(0, self.jitter * job.interval))
+                    if due > now or key in self._running:
+                        continue
+                    slots = None
+                    if job.needs_plex:
+                        slots = self._server_slots.setdefault(
+                            server_key(baseurl), threading.BoundedSemaphore(self.per_server_limit))
+                        if not slots.acquire(blocking=False):
+                            continue
+                    self._running.add(key)
+                    executor.submit(self._run, job, user_id, slots)
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            db.session.execute(sa.delete(JobRun).where(JobRun.started_at < _utcnow() - JOB_RUN_RETENTION))
+            db.session.commit()
+
+    def _run(self, job, user_id, slots):
+        try:
+            with app.app_context():
+                self._record(job, user_id)
+        finally:
+            if slots is not None:
+                slots.release()
+            with self._lock:
+                self._running.discard((job.name, user_id))
+                self._next_run[(job.name, user_id)] = time.monotonic() + self._delay(job.interval)
+
+    def _record(self, job, user_id):
+        user = db.session.get(User, user_id)
+        if user is None:
+            return
+        started_at = _utcnow()
+        started = time.perf_counter()
+        status, error = 'ok', None
+        try:
+            if job.needs_plex:
+                job.run(user, plex_pool.get(user))
+            else:
+                job.run(user)
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'error', str(e)
+            print(f"Error running {job.name} for user {user_id}: {e}", file=sys.stderr)
+        db.session.add(JobRun(job=job.name, user_id=user_id, plex_server_url=user.plex_baseurl,
+                              started_at=started_at, duration_ms=(time.perf_counter() - started) * 1000,
+                              status=status, error=error))
+        db.session.commit()
+
+
+def recent_runs(limit=50):
+    return JobRun.query.order_by(JobRun.started_at.desc()).limit(limit).all()
+
+
+def job_summary():
+    """Per job: runs, failures, average and last duration over the kept history."""
+    rows = db.session.execute(
+        sa.select(JobRun.job, sa.func.count(),
+                  sa.func.sum(sa.case((JobRun.status == 'error', 1), else_=0)),
+                  sa.func.avg(JobRun.duration_ms), sa.func.max(JobRun.started_at))
+        .group_by(JobRun.job).order_by(JobRun.job)).all()
+    return [{'job': job, 'runs': runs, 'errors': errors or 0, 'avg_ms': avg_ms or 0, 'last_run': last_run}
+            for job, runs, errors, avg_ms, last_run in rows]
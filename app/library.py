@@ -0,0 +1,399 @@
+import base64
+import json
+import sys
+from collections import Counter
+from itertools import groupby
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from plexapi import utils
+from app import app, db, plex_fetch
+from app.models import UserPlexLibrary, UserMediaMetadata, UserMediaGenre, UserGenreCount
+
+# Plex section types we mirror locally
+SYNCED_SECTION_TYPES = ('movie', 'show')
+
+# Leading cast names kept per item for search; section listings only carry the first few anyway
+MAX_ACTORS = 5
+
+# An item is re-fetched during an incremental sync when any of these is past the watermark
+WATERMARK_FIELDS = ('updatedAt', 'addedAt', 'lastViewedAt')
+
+# Keys or ids per IN (...) list, well under SQLite's bound-parameter limit
+IN_BATCH = 500
+
+
+def _utcnow():
+    # Stored naive, like every other DateTime column in this database
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _item_fields(item):
+    return {
+        'title': item.title,
+        'sort_title': (item.title or '').lower(),
+        'year': item.year,
+        'media_type': item.type,
+        'content_rating': item.contentRating,
+        'description': item.summary,
+        'actors': ', '.join(item.roles[:MAX_ACTORS]) or None,
+        'view_count': item.viewCount or 0,
+        'added_at': item.addedAt,
+        'updated_at': item.updatedAt,
+    }
+
+
+def _apply_item(media, item, genre_deltas):
+    """Copy a listing's ItemRecord onto a snapshot row; returns True if anything changed."""
+    changed = False
+    for name, value in _item_fields(item).items():
+        if getattr(media, name) != value:
+            setattr(media, name, value)
+            changed = True
+    tags = set(item.genres)
+    for genre in [g for g in media.genres if g.genre not in tags]:
+        media.genres.remove(genre)
+        genre_deltas[genre.genre] -= 1
+        changed = True
+    for tag in sorted(tags - set(media.genre_tags)):
+        media.genres.append(UserMediaGenre(genre=tag))
+        genre_deltas[tag] += 1
+        changed = True
+    if changed:
+        media.last_updated_at = _utcnow()
+    return changed
+
+
+def _upsert_items(library, existing, items, genre_deltas):
+    changed = 0
+    for item in items:
+        key = item.ratingKey
+        media = existing.get(key)
+        if media is None:
+            media = UserMediaMetadata(plex_media_key=key, library=library)
+            db.session.add(media)
+            existing[key] = media
+        changed += _apply_item(media, item, genre_deltas)
+    return changed
+
+
+def _delete_missing(existing, keys, genre_deltas):
+    deleted = 0
+    for key, media in existing.items():
+        if key not in keys:
+            for tag in media.genre_tags:
+                genre_deltas[tag] -= 1
+            db.session.delete(media)
+            deleted += 1
+    return deleted
+
+
+def _apply_genre_deltas(library, genre_deltas):
+    """Adds the sync's +1/-1 genre changes to the library's persisted genre counts."""
+    genre_deltas = {genre: delta for genre, delta in genre_deltas.items() if delta}
+    if not genre_deltas:
+        return
+    rows = {row.genre: row for row in UserGenreCount.query.filter(
+        UserGenreCount.library_id == library.id, UserGenreCount.genre.in_(genre_deltas))}
+    now = _utcnow()
+    for genre, delta in genre_deltas.items():
+        row = rows.get(genre)
+        if row is None:
+            row = UserGenreCount(library_id=library.id, genre=genre, count=0)
+            db.session.add(row)
+        # A genre's row is kept at 0 when its last item goes, so its updated_at
+        # still moves the chart's Last-Modified
+        row.count += delta
+        row.updated_at = now
+
+
+def _all_key(section):
+    return f'/library/sections/{section.key}/all' + utils.joinArgs({'type': utils.searchType(section.type)})
+
+
+def _changed_keys(section, since):
+    """Listings of the items whose updatedAt/addedAt/lastViewedAt is newer than `since`, one per field."""
+    epoch = int(since.replace(tzinfo=timezone.utc).timestamp())
+    libtype = utils.searchType(section.type)
+    return [f'/library/sections/{section.key}/all' + utils.joinArgs({'type': libtype, f'{field}>>': epoch})
+            for field in WATERMARK_FIELDS]
+
+
+def _keys_listing_key(section):
+    # Deletions show up as keys missing from this listing. includeFields trims each
+    # element down to its ratingKey; servers that don't know it ignore it and send everything.
+    libtype = utils.searchType(section.type)
+    return (f'/library/sections/{section.key}/all'
+            + utils.joinArgs({'type': libtype, 'includeFields': 'ratingKey'}))
+
+
+def _section_requests(library, section):
+    """The listings a section's sync needs: everything, or what changed plus the key listing."""
+    if library.last_synced_at is None:
+        return [_all_key(section)]
+    overlap = timedelta(seconds=app.config['LIBRARY_SYNC_OVERLAP'])
+    return _changed_keys(section, library.last_synced_at - overlap) + [_keys_listing_key(section)]
+
+
+def _full_sync_section(library, pages, genre_deltas):
+    existing = {m.plex_media_key: m for m in library.items}
+    changed, keys = 0, set()
+    for _, records in pages:
+        changed += _upsert_items(library, existing, records, genre_deltas)
+        keys.update(record.ratingKey for record in records)
+    return changed + _delete_missing(existing, keys, genre_deltas)
+
+
+def _batched(values):
+    values = list(values)
+    for start in range(0, len(values), IN_BATCH):
+        yield values[start:start + IN_BATCH]
+
+
+def _delete_media(media_ids, genre_deltas):
+    """Bulk-deletes snapshot rows by id, taking their genres off the counts."""
+    for batch in _batched(media_ids):
+        for genre, count in db.session.execute(
+                sa.select(UserMediaGenre.genre, sa.func.count())
+                .where(UserMediaGenre.media_id.in_(batch)).group_by(UserMediaGenre.genre)):
+            genre_deltas[genre] -= count
+        db.session.execute(sa.delete(UserMediaGenre).where(UserMediaGenre.media_id.in_(batch)))
+        db.session.execute(sa.delete(UserMediaMetadata).where(UserMediaMetadata.id.in_(batch)))
+    return len(media_ids)
+
+
+def _incremental_sync_section(library, section, pages, genre_deltas):
+    listing_key = _keys_listing_key(section)
+    changed, keys = {}, set()
+    for key, records in pages:
+        if key == listing_key:
+            keys.update(record.ratingKey for record in records)
+        else:
+            for record in records:
+                changed[record.ratingKey] = record
+    # Only keys and ids for the whole section; ORM rows (and their genres) are
+    # loaded just for the items that changed, so a quiet sync stays cheap
+    stored = dict(db.session.execute(
+        sa.select(UserMediaMetadata.plex_media_key, UserMediaMetadata.id)
+        .where(UserMediaMetadata.library_id == library.id)).all())
+    existing = {}
+    for batch in _batched(key for key in changed if key in stored):
+        existing.update((media.plex_media_key, media) for media in UserMediaMetadata.query.filter(
+            UserMediaMetadata.library_id == library.id, UserMediaMetadata.plex_media_key.in_(batch)))
+    updated = _upsert_items(library, existing, changed.values(), genre_deltas)
+    missing = [media_id for key, media_id in stored.items() if key not in keys and key not in changed]
+    return updated + _delete_media(missing, genre_deltas)
+
+
+def _full_sync_due(library):
+    interval = timedelta(seconds=app.config['LIBRARY_FULL_SYNC_INTERVAL'])
+    return library.last_full_synced_at is None or _utcnow() - library.last_full_synced_at >= interval
+
+
+def sync_library(user, plex, full=False):
+    """
+    Mirrors every movie and show section of the user's Plex server into the
+    UserPlexLibrary / UserMediaMetadata tables.
+
+    Sections that were synced before are updated incrementally: only items
+    changed since the section's last_synced_at watermark are fetched, and
+    deletions are found from a key-only listing. Every item is re-pulled
+    instead when the section's last full sync is LIBRARY_FULL_SYNC_INTERVAL
+    old, or for every section with full=True.
+
+    Listings are streamed page by page (see app/plex_fetch.py) and each page is
+    written as it arrives, so a sync holds a few pages of records at a time
+    rather than whole sections, however big the library.
+    """
+    libraries = {lib.section_key: lib for lib in
+                 UserPlexLibrary.query.filter_by(user_id=user.id,
+                                                 plex_server_url=user.plex_baseurl)}
+    requests = {}
+    for section in plex.library.sections():
+        if section.type not in SYNCED_SECTION_TYPES:
+            continue
+        key = str(section.key)
+        library = libraries.get(key)
+        if library is None:
+            library = UserPlexLibrary(user_id=user.id, plex_server_url=user.plex_baseurl,
+                                      section_key=key)
+            db.session.add(library)
+            libraries[key] = library
+        library.section_title = section.title
+        library.section_type = section.type
+        if full or _full_sync_due(library):
+            library.last_synced_at = None
+        for listing in _section_requests(library, section):
+            requests[listing] = (library, section)
+    db.session.flush()  # The genre counts need the libraries' ids
+
+    # Taken before fetching, so anything changed mid-sync is picked up next time
+    started_at = _utcnow()
+    stream = plex_fetch.stream_containers(plex, requests, page_size=app.config['PLEX_FETCH_PAGE_SIZE'],
+                                          workers=app.config['PLEX_FETCH_WORKERS'])
+    # Pages come back listing by listing in request order, so each section's are consecutive
+    synced = set()
+    for (library, section), pages in groupby(stream, key=lambda page: requests[page[0]]):
+        genre_deltas = Counter()
+        if library.last_synced_at is None:
+            changed = _full_sync_section(library, pages, genre_deltas)
+            library.last_full_synced_at = started_at
+        else:
+            changed = _incremental_sync_section(library, section, pages, genre_deltas)
+        _apply_genre_deltas(library, genre_deltas)
+        if changed:
+            library.content_version = (library.content_version or 0) + 1
+        library.last_synced_at = started_at
+        synced.add(library.section_key)
+    _delete_libraries([lib.id for key, lib in libraries.items() if key not in synced])
+    db.session.commit()
+
+
+def ensure_library(user, connect):
+    """
+    Syncs the user's library if it has never been synced or the snapshot is older
+    than LIBRARY_SYNC_MAX_AGE. `connect()` is only called then, for the PlexServer
+    to sync from (None if Plex can't be reached), so serving a fresh snapshot never
+    touches Plex. Without Plex, or if the sync fails, the stored snapshot is served.
+    """
+    oldest = db.session.scalar(
+        sa.select(sa.func.min(UserPlexLibrary.last_synced_at)).where(*snapshot_filter(user)))
+    max_age = timedelta(seconds=app.config['LIBRARY_SYNC_MAX_AGE'])
+    if oldest is not None and _utcnow() - oldest < max_age:
+        return
+    plex = connect()
+    if plex is None:
+        return
+    try:
+        sync_library(user, plex)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error syncing library for user {user.id}: {e}", file=sys.stderr)
+
+
+def _delete_libraries(library_ids):
+    # Bulk deletes, so dropping a 40k item section doesn't load every row first
+    if not library_ids:
+        return
+    media_ids = sa.select(UserMediaMetadata.id).where(UserMediaMetadata.library_id.in_(library_ids))
+    db.session.execute(sa.delete(UserMediaGenre).where(UserMediaGenre.media_id.in_(media_ids)))
+    db.session.execute(sa.delete(UserGenreCount).where(UserGenreCount.library_id.in_(library_ids)))
+    db.session.execute(sa.delete(UserMediaMetadata).where(UserMediaMetadata.library_id.in_(library_ids)))
+    db.session.execute(sa.delete(UserPlexLibrary).where(UserPlexLibrary.id.in_(library_ids)))
+
+
+def clear_library(user_id):
+    """Deletes the user's whole snapshot, e.g. when they point at another server."""
+    _delete_libraries(db.session.scalars(
+        sa.select(UserPlexLibrary.id).where(UserPlexLibrary.user_id == user_id)).all())
+
+
+def snapshot_filter(user):
+    return (UserPlexLibrary.user_id == user.id,
+            UserPlexLibrary.plex_server_url == user.plex_baseurl)
+
+
+def snapshot_version(user):
+    """
+    Short string that changes whenever the user's snapshot does: a section is
+    added or removed, or a sync changes any of its items.
+    """
+    rows = db.session.execute(
+        sa.select(UserPlexLibrary.id, UserPlexLibrary.content_version)
+        .where(*snapshot_filter(user)).order_by(UserPlexLibrary.id)).all()
+    return '-'.join(f'{library_id}.{version}' for library_id, version in rows) or 'empty'
+
+
+def media_query(user):
+    """Snapshot rows for the user's current Plex server."""
+    return UserMediaMetadata.query.join(UserPlexLibrary).filter(*snapshot_filter(user))
+
+
+def media_type_counts(user):
+    rows = db.session.execute(
+        sa.select(UserMediaMetadata.media_type, sa.func.count())
+        .join(UserPlexLibrary).where(*snapshot_filter(user))
+        .group_by(UserMediaMetadata.media_type))
+    return dict(rows.all())
+
+
+def genre_counts(user):
+    """(genre, items) with the most items first, read from the persisted aggregate rather than counted."""
+    items = sa.func.sum(UserGenreCount.count)
+    return db.session.execute(
+        sa.select(UserGenreCount.genre, items)
+        .join(UserPlexLibrary).where(*snapshot_filter(user))
+        .group_by(UserGenreCount.genre).having(items > 0)
+        .order_by(items.desc(), UserGenreCount.genre)).all()
+
+
+def genre_counts_updated_at(user):
+    """When a sync last changed any of the user's genre counts, as an aware UTC datetime."""
+    updated_at = db.session.scalar(
+        sa.select(sa.func.max(UserGenreCount.updated_at))
+        .join(UserPlexLibrary).where(*snapshot_filter(user)))
+    return updated_at.replace(tzinfo=timezone.utc) if updated_at is not None else None
+
+
+# sort_by value -> column expression; each is paired with the id as a tiebreaker
+SORT_COLUMNS = {
+    'title': UserMediaMetadata.sort_title,
+    'year': sa.func.coalesce(UserMediaMetadata.year, 0),
+    'content_rating': sa.func.lower(sa.func.coalesce(UserMediaMetadata.content_rating, '')),
+}
+
+
+def encode_cursor(value, media_id):
+    raw = json.dumps([value, media_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort value, id) from a cursor made by encode_cursor(); ValueError for anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, media_id = json.loads(raw)
+        if not isinstance(value, (str, int)) or not isinstance(media_id, int):
+            raise ValueError(cursor)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'.") from e
+    return value, media_id
+
+
+def content_page(user, genre=None, year=None, rating=None, sort_by='title', sort_order='asc',
+                 limit=50, cursor=None, offset=0):
+    """
+    One page of the user's snapshot with filtering, sorting and pagination done
+    in the database. Pass the returned cursor back in to get the next page
+    (keyset pagination); offset is only for old page-number clients.
+    Returns (rows, next_cursor), where next_cursor is None on the last page.
+    """
+    query = media_query(user)
+    if genre:
+        query = query.filter(UserMediaMetadata.genres.any(UserMediaGenre.genre == genre))
+    if year:
+        query = query.filter(UserMediaMetadata.year == int(year) if str(year).isdigit()
+                             else sa.false())
+    if rating:
+        query = query.filter(UserMediaMetadata.content_rating == rating)
+
+    sort_column = SORT_COLUMNS.get(sort_by, SORT_COLUMNS['title'])
+    descending = sort_order == 'desc'
+    if cursor:
+        value, media_id = decode_cursor(cursor)
+        position = sa.tuple_(sort_column, UserMediaMetadata.id)
+        query = query.filter(position < (value, media_id) if descending
+                             else position > (value, media_id))
+    if descending:
+        query = query.order_by(sort_column.desc(), UserMediaMetadata.id.desc())
+    else:
+        query = query.order_by(sort_column, UserMediaMetadata.id)
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    rows = query.add_columns(sort_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_value = rows[-1]
+        next_cursor = encode_cursor(last_value, last.id)
+    return [media for media, _ in rows], next_cursor
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from plexapi.server import PlexServer
+from app.cache import TTLCache
+
+
+def serialize_session(s):
+    user_name = s.user.title if s.user else "Unknown User"
+    player_name = s.player.title if s.player else "Unknown Player"
+    content_title = s.title if s.title else "Unknown Content"
+    media_type = s.type if hasattr(s, 'type') else 'N/A'
+
+    view_offset = s.viewOffset / 1000 if hasattr(s, 'viewOffset') else 0
+    duration = s.duration / 1000 if hasattr(s, 'duration') else 0
+
+    progress_percent = 0
+    if duration > 0:
+        progress_percent = (view_offset / duration) * 100
+
+    return {
+        'id': str(getattr(s, 'sessionKey', None) or f"{user_name}/{player_name}/{content_title}"),
+        'user': user_name,
+        'player': player_name,
+        'content': content_title,
+        'type': media_type,
+        'progress': f"{progress_percent:.0f}%" if duration > 0 else "N/A",
+        'state': s.state if hasattr(s, 'state') else 'N/A'
+    }
+
+
+def diff_sessions(old, new):
+    """What changed between two snapshots, keyed by session id."""
+    old_by_id = {s['id']: s for s in old}
+    new_by_id = {s['id']: s for s in new}
+    return {
+        'added': [s for key, s in new_by_id.items() if key not in old_by_id],
+        'updated': [s for key, s in new_by_id.items() if key in old_by_id and old_by_id[key] != s],
+        'removed': [key for key in old_by_id if key not in new_by_id],
+    }
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def server_key(baseurl):
+    return (baseurl or '').strip().rstrip('/').lower()
+
+
+def poller_key(plex, token):
+    """
+    What users must have in common to share a ServerPoller and its snapshot:
+    the server's machineIdentifier and the token polled with. plex.sessions()
+    lists what the token's account may see (a shared user only gets their own
+    streams), so snapshots are only shared between users of the same token.
+    """
+    fingerprint = hashlib.sha256(token.encode()).hexdigest()[:16]
+    return f"{plex.machineIdentifier}/{fingerprint}"
+
+
+def _offer(subscriber, message):
+    try:
+        subscriber.put_nowait(message)
+    except queue.Full:
+        # A stalled client; it gets a fresh snapshot when it reconnects
+        pass
+
+
+class ServerPoller(threading.Thread):
+    """
+    Polls plex.sessions() for one Plex server on behalf of every user who
+    reaches it with the same token (see poller_key), and keeps the latest snapshot with a version number that increases each time the
+    sessions change.
+
+    Polling pauses once nobody has read the snapshot for `linger` seconds, and
+    resumes on the next read. With a `shared` cache, a snapshot another worker
+    process took within the last interval is used instead of polling again.
+    """
+
+    def __init__(self, key, interval, linger, shared=None):
+        super().__init__(daemon=True, name=f"session-collector-{key}")
+        self.key = key
+        # user id -> (baseurl, token) of every registered user, the one polled with first
+        self.credentials = OrderedDict()
+        self.interval = interval
+        self.linger = linger
+        self.shared = shared
+        self.plex = None
+        self.snapshot = []
+        self.version = 0
+        self.error = None
+        self.ready = False
+        self._subscribers = set()
+        # Nobody has asked for this server yet, so don't poll until someone does
+        self._last_read = float('-inf')
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+
+    def add_user(self, user):
+        """Adds or updates the user's credentials; only call it once they've connected."""
+        credentials = (user.plex_baseurl, user.plex_token)
+        with self._changed:
+            if self.credentials.get(user.id) == credentials:
+                return
+            if self._polls_with(user.id):
+                self.plex = None
+            self.credentials[user.id] = credentials
+
+    def remove_user(self, user_id):
+        with self._changed:
+            if self._polls_with(user_id):
+                self.plex = None
+            self.credentials.pop(user_id, None)
+
+    def _polls_with(self, user_id):
+        # Callers hold self._changed
+        return next(iter(self.credentials), None) == user_id
+
+    def touch(self):
+        self._last_read = time.monotonic()
+        self._wake.set()
+
+    def wait_ready(self, timeout):
+        self.touch()
+        with self._changed:
+            self._changed.wait_for(lambda: self.ready, timeout)
+
+    def wait_for_change(self, since, timeout):
+        """Blocks until the snapshot version is past `since` (long polling)."""
+        self.touch()
+        with self._changed:
+            self._changed.wait_for(lambda: self.ready and self.version > since, timeout)
+
+    def subscribe(self):
+        """Queue of (event, data) pairs, starting with a 'snapshot' of the current sessions."""
+        self.touch()
+        subscriber = queue.Queue(maxsize=100)
+        with self._changed:
+            self._subscribers.add(subscriber)
+            if self.ready:
+                _offer(subscriber, ('snapshot', self.snapshot))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._changed:
+            self._subscribers.discard(subscriber)
+        self._last_read = time.monotonic()
+
+    def _fetch(self):
+        if self.shared is not None:
+            sessions = self.shared.get(self.key)
+            if sessions is not None:
+                return sessions
+        with self._changed:
+            plex = self.plex
+            credentials = next(iter(self.credentials.values()))
+        if plex is None:
+            plex = PlexServer(*credentials)
+            with self._changed:
+                # Not kept if its user was removed or changed token while connecting
+                if next(iter(self.credentials.values()), None) == credentials:
+                    self.plex = plex
+        sessions = [serialize_session(s) for s in plex.sessions()]
+        if self.shared is not None:
+            self.shared.set(self.key, sessions)
+        return sessions
+
+    def poll(self):
+        try:
+            sessions = self._fetch()
+        except Exception as e:
+            print(f"Error polling active sessions on {self.key}: {e}", file=sys.stderr)
+            with self._changed:
+                # The server may be unreachable at this URL; try the next user's on the next poll
+                if self.credentials:
+                    self.credentials.move_to_end(next(iter(self.credentials)))
+                self.plex = None
+                self.error = str(e)
+                self.ready = True
+                self._publish('upstream_error', {'error': f"Failed to fetch active sessions: {e}"})
+                self._changed.notify_all()
+            return
+        # Swap the snapshot and publish under the lock, so a viewer subscribing
+        # concurrently sees either the old snapshot plus this diff or the new one
+        with self._changed:
+            self.error = None
+            if not self.ready:
+                self.snapshot = sessions
+                self.version += 1
+                self.ready = True
+                self._publish('snapshot', sessions)
+            else:
+                changes = diff_sessions(self.snapshot, sessions)
+                if any(changes.values()):
+                    self.snapshot = sessions
+                    self.version += 1
+                    self._publish('diff', changes)
+            self._changed.notify_all()
+
+    def _publish(self, event, data):
+        # Callers hold self._changed
+        for subscriber in self._subscribers:
+            _offer(subscriber, (event, data))
+
+    def _idle(self):
+        # With nobody registered there's no token to poll with
+        return not self.credentials or (not self._subscribers
+                                        and time.monotonic() - self._last_read > self.linger)
+
+    def run(self):
+        while True:
+            if self._idle():
+                self._wake.clear()
+                # Re-check after clearing, so a touch() in between isn't lost
+                if self._idle():
+                    self._wake.wait()
+                    # The snapshot is stale after a pause; make new readers wait for a fresh poll
+                    with self._changed:
+                        self.ready = False
+            self.poll()
+            time.sleep(self.interval)
+
+
+class SessionCollector:
+    """
+    Background service that polls each Plex server once per interval per
+    token, no matter how many registered users share that token, and serves
+    the latest session snapshot to all of them. Given a shared cache `backend`, worker
+    processes also share snapshots, so the server is polled about once per
+    interval per host rather than per process.
+
+    A user only joins a poller with a PlexServer their own token connected to,
+    and pollers are per server and token (see poller_key), so nobody sees
+    sessions their own token couldn't list.
+    """
+
+    def __init__(self, interval=5, linger=60, backend=None):
+        self.interval = interval
+        self.linger = linger
+        self.shared = (TTLCache(ttl=interval, namespace='session_snapshots', backend=backend)
+                       if backend is not None else None)
+        self._pollers = {}  # poller_key -> ServerPoller
+        self._lock = threading.Lock()
+
+    def register(self, user, plex):
+        """
+        The poller for the user's server, created on first use. `plex` must be a
+        PlexServer connected with the user's own credentials (see PlexConnectionPool).
+        """
+        key = poller_key(plex, user.plex_token)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = ServerPoller(key, self.interval, self.linger, self.shared)
+                poller.add_user(user)
+                self._pollers[key] = poller
+                poller.start()
+                return poller
+            # A user switching server or token leaves the old poller
+            for other in self._pollers.values():
+                if other is not poller:
+                    other.remove_user(user.id)
+        poller.add_user(user)
+        return poller
+
+    def unregister(self, user_id):
+        """Stops polling with the user's token, e.g. once it's changed or the account is deleted."""
+        with self._lock:
+            pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.remove_user(user_id)
@@ -1,9 +1,8 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
-from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import db, passwords
 
 class User(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -13,11 +12,133 @@ class User(db.Model):
     plex_baseurl: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
     plex_token: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
 
+    # Hashing runs in the bounded pool in app/passwords.py, with the PASSWORD_HASH_METHOD policy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = passwords.offload(passwords.hash_password, password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.offload(passwords.verify_password, self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
+
+    def __repr__(self):
+        return '<User {}>'.format(self.username)
+
+class UserPlexLibrary(db.Model):
+    # One row per synced Plex library section (Movies, TV Shows, ...) of a user
+    __table_args__ = (sa.UniqueConstraint('user_id', 'plex_server_url', 'section_key'),)
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id, ondelete='CASCADE'),
+                                               index=True)
+    plex_server_url: so.Mapped[str] = so.mapped_column(sa.String(256))
+    section_key: so.Mapped[str] = so.mapped_column(sa.String(32))
+    section_title: so.Mapped[str] = so.mapped_column(sa.String(128))
+    section_type: so.Mapped[str] = so.mapped_column(sa.String(16))
+    last_synced_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    # When every item was last re-pulled, repairing drift incremental syncs can't see
+    last_full_synced_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    # Bumped by every sync that changes an item, so caches can tell when to rebuild
+    content_version: so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+
+    items: so.Mapped[list['UserMediaMetadata']] = so.relationship(
+        back_populates='library', cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return '<UserPlexLibrary {} {}>'.format(self.user_id, self.section_title)
+
+
+class UserMediaMetadata(db.Model):
+    # Local copy of one movie or show, so pages don't have to pull the library from Plex
+    __table_args__ = (sa.UniqueConstraint('library_id', 'plex_media_key'),)
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    library_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(UserPlexLibrary.id, ondelete='CASCADE'), index=True)
+    plex_media_key: so.Mapped[str] = so.mapped_column(sa.String(64))
+    title: so.Mapped[str] = so.mapped_column(sa.String(255), index=True)
+    # Lower-cased title, so case-insensitive title ordering can walk an index
+    sort_title: so.Mapped[Optional[str]] = so.mapped_column(sa.String(255), index=True)
+    year: so.Mapped[Optional[int]] = so.mapped_column(index=True)
+    media_type: so.Mapped[str] = so.mapped_column(sa.String(50), index=True)
+    content_rating: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32), index=True)
+    description: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    # Comma-separated names of the leading cast, as listed by the section; feeds title search
+    actors: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
+    view_count: so.Mapped[int] = so.mapped_column(default=0)
+    added_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    updated_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime)
+    last_updated_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    library: so.Mapped[UserPlexLibrary] = so.relationship(back_populates='items')
+    genres: so.Mapped[list['UserMediaGenre']] = so.relationship(
+        back_populates='media', cascade='all, delete-orphan', passive_deletes=True,
+        lazy='selectin')
+
+    @property
+    def genre_tags(self):
+        return [g.genre for g in self.genres]
 
     def __repr__(self):
-        return '<User {}>'.format(self.username)
\ No newline at end of file
+        return '<UserMediaMetadata {}>'.format(self.title)
+
+
+class UserMediaGenre(db.Model):
+    media_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(UserMediaMetadata.id, ondelete='CASCADE'), primary_key=True)
+    genre: so.Mapped[str] = so.mapped_column(sa.String(128), primary_key=True, index=True)
+
+    media: so.Mapped[UserMediaMetadata] = so.relationship(back_populates='genres')
+
+
+class UserGenreCount(db.Model):
+    # Items per genre in one synced section, kept up to date by the sync's +1/-1 deltas
+    library_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(UserPlexLibrary.id, ondelete='CASCADE'), primary_key=True)
+    genre: so.Mapped[str] = so.mapped_column(sa.String(128), primary_key=True)
+    count: so.Mapped[int] = so.mapped_column(default=0)
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class WatchHistory(db.Model):
+    # One play from a user's Plex watch history; rows are only ever appended
+    __table_args__ = (sa.UniqueConstraint('user_id', 'plex_server_url', 'history_key'),
+                      sa.Index('ix_watch_history_user_viewed_at', 'user_id', 'viewed_at'))
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id, ondelete='CASCADE'))
+    plex_server_url: so.Mapped[str] = so.mapped_column(sa.String(256))
+    history_key: so.Mapped[str] = so.mapped_column(sa.String(128))
+    rating_key: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64))
+    # The show for episodes, the title for everything else
+    title: so.Mapped[str] = so.mapped_column(sa.String(255))
+    media_type: so.Mapped[Optional[str]] = so.mapped_column(sa.String(50))
+    account_id: so.Mapped[Optional[str]] = so.mapped_column(sa.String(32))
+    viewed_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime)
+
+
+class WatchHistoryRollup(db.Model):
+    # Plays per title per day or week (UTC, weeks start on Monday), added to as history is ingested
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(User.id, ondelete='CASCADE'), primary_key=True)
+    bucket: so.Mapped[str] = so.mapped_column(sa.String(8), primary_key=True)
+    period_start: so.Mapped[date] = so.mapped_column(sa.Date, primary_key=True)
+    title: so.Mapped[str] = so.mapped_column(sa.String(255), primary_key=True)
+    plays: so.Mapped[int] = so.mapped_column(default=0)
+
+
+class JobRun(db.Model):
+    # One run of a background job (see app/jobs.py), shown on the admin page
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    job: so.Mapped[str] = so.mapped_column(sa.String(32))
+    user_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.ForeignKey(User.id, ondelete='SET NULL'), index=True)
+    plex_server_url: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
+    started_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime, index=True)
+    duration_ms: so.Mapped[float] = so.mapped_column(default=0)
+    # 'ok' or 'error'
+    status: so.Mapped[str] = so.mapped_column(sa.String(16))
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from app import app
+
+try:
+    import argon2
+except ImportError:  # argon2 methods need the argon2-cffi package
+    argon2 = None
+
+# Werkzeug's parameters for methods given without them; stored hashes always spell them out
+SCRYPT_DEFAULTS = ('32768', '8', '1')
+
+
+class HashingBusy(Exception):
+    """Raised when PASSWORD_HASH_QUEUE hashing jobs are already waiting for the pool."""
+
+
+def _policy(method):
+    """
+    A PASSWORD_HASH_METHOD value with its parameters filled in, as it appears
+    at the start of a stored hash, so a stored hash can be compared to it.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        return ':'.join(['scrypt', *(args or SCRYPT_DEFAULTS)])
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'argon2':
+        if argon2 is None:
+            raise ValueError("PASSWORD_HASH_METHOD 'argon2' needs the argon2-cffi package.")
+        return method
+    raise ValueError(f"Invalid PASSWORD_HASH_METHOD '{method}'.")
+
+
+POLICY = _policy(app.config['PASSWORD_HASH_METHOD'])
+
+
+def _argon2_hasher():
+    # argon2[:time_cost:memory_cost_kib:parallelism]; argon2-cffi's defaults otherwise
+    params = [int(arg) for arg in POLICY.split(':')[1:]]
+    return argon2.PasswordHasher(*params)
+
+
+def hash_password(password):
+    """Hashes `password` with the current PASSWORD_HASH_METHOD."""
+    if POLICY.startswith('argon2'):
+        return _argon2_hasher().hash(password)
+    return generate_password_hash(password, method=POLICY)
+
+
+def verify_password(password_hash, password):
+    """Checks `password` against a stored hash made with any supported method."""
+    if not password_hash:
+        return False
+    if password_hash.startswith('$argon2'):
+        if argon2 is None:
+            return False
+        try:
+            return argon2.PasswordHasher().verify(password_hash, password)
+        # A malformed stored hash is a failed login, not a server error
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with another method or work factor than the current policy."""
+    if POLICY.startswith('argon2'):
+        return not password_hash.startswith('$argon2') or _argon2_hasher().check_needs_rehash(password_hash)
+    return password_hash.split('$', 1)[0] != POLICY
+
+
+# hashlib's pbkdf2/scrypt and argon2-cffi release the GIL, so a few threads hash in
+# parallel while request threads only wait; the semaphore caps the backlog
+_pool = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                           thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_WORKERS'] + app.config['PASSWORD_HASH_QUEUE'])
+
+
+def offload(fn, *args):
+    """
+    Runs fn(*args) (hash_password, verify_password) in the bounded hashing pool
+    and returns its result. During a login storm at most PASSWORD_HASH_WORKERS
+    hashes run at once; past PASSWORD_HASH_QUEUE waiting ones, HashingBusy is
+    raised instead of queueing without limit.
+    """
+    if not _slots.acquire(timeout=app.config['PASSWORD_HASH_WAIT']):
+        raise HashingBusy()
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        _slots.release()
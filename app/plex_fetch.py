@@ -0,0 +1,90 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+from plexapi import utils
+
+
+class ItemRecord:
+    """
+    The fields a library sync reads from one movie or show of a listing, parsed
+    straight from the XML. Stands in for a plexapi Movie/Show, which would keep
+    its whole element tree and reload machinery alive.
+    """
+
+    __slots__ = ('ratingKey', 'title', 'type', 'year', 'contentRating', 'summary', 'viewCount',
+                 'addedAt', 'updatedAt', 'genres', 'roles')
+
+    def __init__(self, element):
+        attrib = element.attrib
+        self.ratingKey = attrib.get('ratingKey')
+        self.title = attrib.get('title')
+        self.type = attrib.get('type')
+        self.year = utils.cast(int, attrib.get('year'))
+        self.contentRating = attrib.get('contentRating')
+        self.summary = attrib.get('summary')
+        self.viewCount = utils.cast(int, attrib.get('viewCount', 0))
+        # Same conversion plexapi uses, so values compare equal to earlier syncs'
+        self.addedAt = utils.toDatetime(attrib.get('addedAt'))
+        self.updatedAt = utils.toDatetime(attrib.get('updatedAt'))
+        self.genres = [child.attrib['tag'] for child in element.iterfind('Genre') if 'tag' in child.attrib]
+        self.roles = [child.attrib['tag'] for child in element.iterfind('Role') if 'tag' in child.attrib]
+
+
+def _page(plex, key, start, size, parse=ItemRecord):
+    """
+    (totalSize, [parse(element), ...]) for one container page, ItemRecords by
+    default. The response is parsed as it streams in, and each item's elements
+    are dropped as soon as its record is built, so no page-sized element tree
+    is ever held.
+    """
+    headers = plex._headers(**{'X-Plex-Container-Start': str(start), 'X-Plex-Container-Size': str(size)})
+    response = plex._session.get(plex.url(key), headers=headers, timeout=plex._timeout, stream=True)
+    with response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        total, records, depth, root = 0, [], 0, None
+        for event, element in ElementTree.iterparse(response.raw, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = element
+                    total = int(element.attrib.get('totalSize') or element.attrib.get('size') or 0)
+                continue
+            depth -= 1
+            if depth == 1:
+                # A direct child of the MediaContainer: one movie, show, ...
+                records.append(parse(element))
+                root.clear()
+    return total, records
+
+
+def stream_containers(plex, keys, page_size=500, workers=4, parse=ItemRecord):
+    """
+    Yields (key, records) for every container key, key by key and page by page
+    in order, with up to `workers` requests in flight at once. Each record is
+    parse(element) for one child of the MediaContainer.
+
+    The first pages of all keys are requested together (they also give each
+    container's totalSize), and the following pages are requested while
+    earlier ones are consumed, at most `workers` ahead. Memory stays bounded
+    by a handful of pages of records, however big the library, while several
+    sections still load in about the time of the largest.
+    """
+    keys = list(dict.fromkeys(keys))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plex-fetch') as executor:
+        first_pages = {key: executor.submit(_page, plex, key, 0, page_size, parse) for key in keys}
+        for key in keys:
+            total, records = first_pages.pop(key).result()
+            yield key, records
+            starts = iter(range(page_size, total, page_size))
+            window = deque()
+            for start in starts:
+                window.append(executor.submit(_page, plex, key, start, page_size, parse))
+                if len(window) >= workers:
+                    break
+            while window:
+                _, records = window.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    window.append(executor.submit(_page, plex, key, start, page_size, parse))
+                yield key, records
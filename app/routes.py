@@ -1,24 +1,54 @@
+import queue
 import sys
-from collections import defaultdict
-from flask import render_template, request, redirect, url_for, session, flash, jsonify
-from plexapi.server import PlexServer
-from app import app, db
+from flask import render_template, request, redirect, url_for, session, flash, jsonify, g, Response, \
+    stream_with_context
+from app import app, db, plex_pool, cache_backend, session_collector, scheduler, cache_warmer, library, facets, \
+    history, live_sessions, search, suggest, catalog, jobs, export, users, passwords
+from app.cache import SWRCache
+from app.http_cache import http_cache
 from app.models import User
-from werkzeug.security import generate_password_hash, check_password_hash
 import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from types import SimpleNamespace
 from config import Config
 
+# Per-user dashboard counts. Refreshing the dashboard doesn't re-query Plex: counts are
+# reused for DASHBOARD_CACHE_TTL seconds, then served stale while refreshed in the background.
+# A set with a failed count isn't kept.
+dashboard_cache = SWRCache(ttl=app.config['DASHBOARD_CACHE_TTL'],
+                           stale_ttl=app.config['DASHBOARD_CACHE_STALE_TTL'],
+                           cacheable=lambda counts: None not in counts.values(),
+                           namespace='dashboard_counts', backend=cache_backend)
+
+@app.before_request
+def start_background_jobs():
+    # Started here rather than at import, so `flask db upgrade` and the like don't run jobs;
+    # the lock leaves a single web worker process per host running them
+    if not scheduler.started and app.config['SCHEDULER_MODE'] == 'thread':
+        scheduler.start(lock_path=app.config['SCHEDULER_LOCK_PATH'])
+    # The warmed caches are per process, so each worker process warms its own
+    if not cache_warmer.started and app.config['SCHEDULER_MODE'] != 'off':
+        cache_warmer.start()
+
 def login_required(view):
     @functools.wraps(view)
     def wrapped_view(*args, **kwargs):
         if 'logged_in' not in session or not session['logged_in']:
             flash("Please log in to access this page.", "warning")
             return redirect(url_for('login'))
+        if users.current_user() is None:
+            # The account was deleted (say, from another browser) since this session logged in
+            session.pop('logged_in', None)
+            session.pop('user_id', None)
+            flash("Your account no longer exists. Please log in again.", "warning")
+            return redirect(url_for('login'))
         return view(*args, **kwargs)
     return wrapped_view
 
 # This is the old method for connecting to PLEX - works fine if there's only a single user and no user accounts
-# The new method get_user_plex() is better for serving multiple users
+# The new method get_user_plex() is better for serving multiple users, and reuses
+# connections through the process-wide plex_pool instead of reconnecting every request
 # try:
 #     plex = PlexServer(Config.PLEX_BASEURL, Config.PLEX_TOKEN)
 #     print("Successfully connected to Plex Media Server.")
@@ -27,52 +57,86 @@ def login_required(view):
 #     plex = None
 
 def get_user_plex():
+    # Once per request: an http_cache version check and its view both ask for it
+    if 'plex' not in g:
+        g.plex = _connect_user_plex()
+    return g.plex
+
+def _connect_user_plex():
     if 'user_id' not in session:
         return None
-    user = User.query.get(session['user_id'])
+    user = users.current_user()
     if not user or not user.plex_baseurl or not user.plex_token:
         flash("Plex credentials not found for your account.", "danger")
         return None
     try:
-        plex = PlexServer(user.plex_baseurl, user.plex_token)
+        plex = plex_pool.get(user)
         return plex
     except Exception as e:
         flash(f"Error connecting to your Plex server: {e}", "danger")
         return None
 
+def fetch_dashboard_counts(plex):
+    """
+    Movie, TV show and active session counts from Plex, fetched concurrently.
+    The library counts use totalSize, a container-size-0 query that returns
+    just the count rather than every item. A count that fails comes back as None.
+    """
+    calls = {
+        'movie_count': lambda: plex.library.section('Movies').totalSize,
+        'tv_show_count': lambda: plex.library.section('TV Shows').totalSize,
+        'active_sessions_count': lambda: len(plex.sessions()),
+    }
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = {name: executor.submit(call) for name, call in calls.items()}
+    counts = {}
+    for name, future in futures.items():
+        try:
+            counts[name] = future.result()
+        except Exception as e:
+            print(f"Error fetching {name} for dashboard: {e}", file=sys.stderr)
+            counts[name] = None
+    return counts
+
 @app.route('/')
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user = User.query.get(session['user_id'])
-    plex = get_user_plex()
-    user_count = User.query.count()
-    movie_count = 0
-    tv_show_count = 0
-    active_sessions_count = 0
+    user = users.current_user()
+    user_count = users.user_count()
     recommendations = []
 
-    if plex:
+    counts = {'movie_count': None, 'tv_show_count': None, 'active_sessions_count': None}
+    if user.plex_baseurl and user.plex_token:
+        # Refreshes may run after this request is gone, so they get the credentials, not the row
+        credentials = SimpleNamespace(id=user.id, plex_baseurl=user.plex_baseurl, plex_token=user.plex_token)
         try:
-            movie_count = len(plex.library.section('Movies').all())
-        except Exception:
-            pass
-        try:
-            tv_show_count = len(plex.library.section('TV Shows').all())
-        except Exception:
-            pass
-        try:
-            active_sessions_count = len(plex.sessions())
-        except Exception:
-            pass
-        
+            counts = dashboard_cache.get(user.id, lambda: fetch_dashboard_counts(plex_pool.get(credentials)))
+        except Exception as e:
+            flash(f"Error connecting to your Plex server: {e}", "danger")
+    else:
+        flash("Plex credentials not found for your account.", "danger")
+
+    # Fall back to the local snapshot if Plex couldn't give us a count
+    if counts['movie_count'] is None or counts['tv_show_count'] is None:
+        type_counts = library.media_type_counts(user)
+        counts = dict(counts)
+        if counts['movie_count'] is None:
+            counts['movie_count'] = type_counts.get('movie', 0)
+        if counts['tv_show_count'] is None:
+            counts['tv_show_count'] = type_counts.get('show', 0)
 
     return render_template('dashboard.html', 
                            title="Admin Dashboard",
                            user_count=user_count,
-                           movie_count=movie_count,
-                           tv_show_count=tv_show_count,
-                           active_sessions_count=active_sessions_count)
+                           movie_count=counts['movie_count'],
+                           tv_show_count=counts['tv_show_count'],
+                           active_sessions_count=counts['active_sessions_count'] or 0)
+
+@app.errorhandler(passwords.HashingBusy)
+def password_hashing_busy(e):
+    flash("Too many sign-ins at once right now. Please try again in a moment.", "warning")
+    return redirect(request.path)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -83,6 +147,10 @@ def login():
         user = User.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                # Moves old hashes onto the current PASSWORD_HASH_METHOD while the password is at hand
+                user.set_password(password)
+                db.session.commit()
             session['logged_in'] = True
             session['user_id'] = user.id # Store user ID in session
             flash("Logged in successfully!", "success")
@@ -130,10 +198,12 @@ def logout():
 @login_required
 def user_management():
     # Security check: only allow 'admin' user to see this page
-    user = User.query.get(session['user_id'])
+    user = users.current_user()
     if user and user.username == 'admin':
-        users = User.query.all()
-        return render_template('user_management.html', users=users, title="User Management")
+        all_users = User.query.all()
+        return render_template('user_management.html', users=all_users,
+                               pool_stats=plex_pool.stats(), job_summary=jobs.job_summary(),
+                               job_runs=jobs.recent_runs(), title="User Management")
     else:
         # Redirect non-admin users to their own profile page for security
         flash("You do not have permission to view this page.", "danger")
@@ -142,13 +212,13 @@ def user_management():
 @app.route('/profile')
 @login_required
 def profile():
-    user = User.query.get(session['user_id'])
+    user = users.current_user()
     return render_template('profile.html', user=user, title="My Profile")
 
 @app.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def profile_edit():
-    user = User.query.get(session['user_id'])
+    user = users.current_user()
     if not user:
         flash("User not found.", "danger")
         return redirect(url_for('dashboard'))
@@ -160,10 +230,20 @@ def profile_edit():
             user.set_password(new_password)
 
         # Handle Plex URL and Token updates
-        user.plex_baseurl = request.form.get('plex_baseurl')
+        new_baseurl = request.form.get('plex_baseurl')
+        if new_baseurl != user.plex_baseurl:
+            # The old snapshot and watch history belong to a different server
+            library.clear_library(user.id)
+            history.clear_history(user.id)
+        user.plex_baseurl = new_baseurl
         user.plex_token = request.form.get('plex_token')
 
         db.session.commit()
+        # Drop any pooled connection and cached data from the old credentials
+        plex_pool.invalidate_user(user.id)
+        dashboard_cache.invalidate(user.id)
+        # The old token stops being polled with; the new one joins once it has connected
+        session_collector.unregister(user.id)
         flash("Profile updated successfully!", "success")
         return redirect(url_for('profile'))
 
@@ -177,11 +257,16 @@ def profile_delete():
         flash("Could not find user to delete.", "danger")
         return redirect(url_for('dashboard'))
     
-    user_to_delete = User.query.get(user_id_to_delete)
+    user_to_delete = users.load_user(user_id_to_delete)
     if user_to_delete:
         try:
+            library.clear_library(user_to_delete.id)
+            history.clear_history(user_to_delete.id)
             db.session.delete(user_to_delete)
             db.session.commit()
+            plex_pool.invalidate_user(user_id_to_delete)
+            session_collector.unregister(user_id_to_delete)
+            catalog.invalidate(user_id_to_delete)
             
             # Log the user out after successful deletion
             session.pop('logged_in', None)
@@ -197,22 +282,26 @@ def profile_delete():
     flash("Account not found.", "danger")
     return redirect(url_for('dashboard'))
 
+def _content_version():
+    # Only the JSON path is cached; the HTML page carries flash messages
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest' and 'page' not in request.args:
+        return None
+    return _library_version()
+
+def _library_version():
+    """The snapshot version, for http_cache; syncs first if the snapshot is stale."""
+    user = users.current_user()
+    library.ensure_library(user, get_user_plex)
+    return library.snapshot_version(user)
+
 @app.route('/content')
 @login_required
+@http_cache(_content_version, max_age=Config.API_CACHE_MAX_AGE)
 def list_all_content():
     """
-    Returns a list of all content (movies and TV shows) from Plex,
-    with options for filtering, sorting, and pagination.
+    Returns a list of all content (movies and TV shows) from the local library
+    snapshot, with options for filtering, sorting, and pagination.
     """
-    plex = get_user_plex()
-    if not plex:
-        # Return a JSON error if a client-side request fails
-        if 'page' in request.args:
-            return jsonify({"error": "Plex server not connected."}), 500
-        # For a regular page load, render the initial page and pass a flash message
-        flash("Plex server not connected.", "danger")
-        return render_template('content.html', content_list=[], title="All Content")
-
     # Get filter and sort parameters from URL query string
     genre_filter = request.args.get('genre')
     year_filter = request.args.get('year')
@@ -220,60 +309,61 @@ def list_all_content():
     sort_by = request.args.get('sort_by', 'title')
     sort_order = request.args.get('sort_order', 'asc')
 
-    all_content = []
+    # Infinite scroll passes back the cursor from X-Next-Cursor; page is still
+    # accepted for clients that don't. Checked here, so a bad value is a 400
+    # rather than the HTML error page
     try:
-        movies_section = plex.library.section('Movies')
-        tv_shows_section = plex.library.section('TV Shows')
-        all_items = movies_section.all() + tv_shows_section.all()
+        page = max(1, int(request.args.get('page', 1)))
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+    except ValueError:
+        return jsonify({"error": "page and limit must be integers."}), 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            library.decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Get unique genres, years, and ratings for filter dropdowns
-        all_genres = sorted(list(set(g.tag for item in all_items for g in item.genres)))
-        all_years = sorted(list(set(item.year for item in all_items if item.year)))
-        all_ratings = sorted(list(set(item.contentRating for item in all_items if item.contentRating)))
-
-        # Filter content
-        filtered_content = []
-        for item in all_items:
-            # Check genre filter
-            if genre_filter and (not hasattr(item, 'genres') or genre_filter not in [g.tag for g in item.genres]):
-                continue
-            # Check year filter
-            if year_filter and (not hasattr(item, 'year') or str(item.year) != year_filter):
-                continue
-            # Check rating filter
-            if rating_filter and (not hasattr(item, 'contentRating') or item.contentRating != rating_filter):
-                continue
-
-            # Add to filtered list
-            filtered_content.append({
-                'type': item.type,
-                'title': item.title,
-                'year': item.year,
-                'summary': item.summary,
-                'genre_tags': [g.tag for g in getattr(item, 'genres', [])],
-                'content_rating': getattr(item, 'contentRating', 'N/A')
-            })
-
-        # Sort content
-        if sort_by in ['title', 'year', 'content_rating']:
-            reverse = (sort_order == 'desc')
-            # The key handles None/non-numeric values gracefully
-            if sort_by == 'title' or sort_by == 'content_rating':
-                filtered_content.sort(key=lambda x: str(x.get(sort_by) or '').lower(), reverse=reverse)
-            elif sort_by == 'year':
-                filtered_content.sort(key=lambda x: int(x.get(sort_by) or 0) if x.get(sort_by) is not None else 0, reverse=reverse)
-        
-        # Paginate content for infinite scroll
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        start_index = (page - 1) * limit
-        end_index = start_index + limit
-        paginated_content = filtered_content[start_index:end_index]
+    user = users.current_user()
+    try:
+        # Read from the local library snapshot, connecting to Plex only when it's stale
+        library.ensure_library(user, get_user_plex)
+
+        # Filter, sort and paginate in the database so a page costs O(page size)
+        rows, next_cursor = library.content_page(user,
+                                                 genre=genre_filter,
+                                                 year=year_filter,
+                                                 rating=rating_filter,
+                                                 sort_by=sort_by,
+                                                 sort_order=sort_order,
+                                                 limit=limit,
+                                                 cursor=cursor,
+                                                 offset=(page - 1) * limit)
+        paginated_content = [{
+            'type': item.media_type,
+            'title': item.title,
+            'year': item.year,
+            'summary': item.description,
+            'genre_tags': item.genre_tags,
+            'content_rating': item.content_rating
+        } for item in rows]
 
         # Check if this is a request from the JavaScript client
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'page' in request.args:
-             return jsonify(paginated_content)
-        
+            response = jsonify(paginated_content)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            # Match count is a bitmap intersection in the facet index, not a COUNT(*) scan
+            response.headers['X-Total-Count'] = str(facets.get_facets(user).count(
+                genre=genre_filter, year=year_filter, rating=rating_filter))
+            return response
+
+        # Get unique genres, years, and ratings for filter dropdowns
+        facet_index = facets.get_facets(user)
+        all_genres = facet_index.values('genre')
+        all_years = facet_index.values('year')
+        all_ratings = facet_index.values('rating')
+
         # For a regular page load, render the initial content and pass filter/sort params
         return render_template('content.html',
                                content_list=paginated_content,
@@ -292,33 +382,76 @@ def list_all_content():
         print(f"Error fetching content: {e}", file=sys.stderr)
         return render_template('content.html', content_list=[], title="All Content")
 
+@app.route('/api/content/facets')
+@login_required
+def get_content_facets():
+    """
+    Genre, year and rating counts for the content filters, narrowed by any
+    filters already picked (?genre=&year=&rating=).
+    """
+    user = users.current_user()
+    facet_index = facets.get_facets(user)
+    return jsonify(facet_index.counts(genre=request.args.get('genre'),
+                                      year=request.args.get('year'),
+                                      rating=request.args.get('rating')))
+
+@app.route('/api/content/export')
+@login_required
+def export_content():
+    """
+    The user's whole library snapshot in one streamed response, for reporting
+    jobs: ?format=ndjson (default, one object per line) or ?format=json (one
+    array), with ?fields=title,year,... to send only some fields.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in export.MIMETYPES:
+        return jsonify({"error": f"Unknown export format '{export_format}'."}), 400
+    try:
+        fields = export.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    user = users.current_user()
+    # Syncs first if the snapshot is stale; without Plex the stored snapshot is exported
+    library.ensure_library(user, get_user_plex)
+    batches = export.batches(user, fields, batch_size=app.config['EXPORT_BATCH_SIZE'])
+    chunks = export.ndjson(batches) if export_format == 'ndjson' else export.json_array(batches)
+    return Response(stream_with_context(chunks), mimetype=export.MIMETYPES[export_format],
+                    headers={'Content-Disposition': f'attachment; filename=library.{export_format}'})
+
+@app.route('/api/search/suggest')
+@login_required
+def search_suggest():
+    """
+    Typeahead titles for the search box (?q=&limit=), answered from an in-memory
+    index of the user's library snapshot.
+    """
+    user = users.current_user()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    title_index = suggest.get_title_index(user)
+    return jsonify([{'id': record.id, 'title': record.title, 'year': record.year, 'type': record.media_type}
+                    for record in title_index.suggest(request.args.get('q', ''), k=limit)])
+
 @app.route('/movies/search', methods=['GET']) # Changed to GET to match frontend fetch
 @login_required
 def search_movies():
-    plex = get_user_plex()
-    if not plex:
-        # Return a JSON error if a client-side request fails
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({"error": "Plex server not connected."}), 500
-        # For a regular page load, render the initial HTML page
-        flash("Plex server not connected.", "danger")
-        return render_template('movie_search.html', search_results=[], search_term="", title="Search Movies")
-    
     search_results = []
     # Get search term from URL query string for GET request
     search_term = request.args.get('search_term', '').strip()
     
     if search_term:
+        user = users.current_user()
         try:
-            movies_section = plex.library.section('Movies')
-            movies = movies_section.search(search_term)
-            for movie in movies:
-                search_results.append({'title': movie.title, 'year': movie.year, 'summary': movie.summary})
-            search_results.sort(key=lambda x: str(x['title']).lower())
+            # Answered from the local full-text index over the library snapshot, ranked
+            # by relevance, with the last word matched as a prefix for typeahead
+            library.ensure_library(user, get_user_plex)
+            for item in search.search(user, search_term):
+                search_results.append({'type': item.media_type, 'title': item.title, 'year': item.year,
+                                       'summary': item.description})
             if not search_results:
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                    return jsonify({"error": f"No movies found matching '{search_term}'."}), 404
-                flash(f"No movies found matching '{search_term}'.", "info")
+                    return jsonify({"error": f"No movies or shows found matching '{search_term}'."}), 404
+                flash(f"No movies or shows found matching '{search_term}'.", "info")
         except Exception as e:
             flash(f"Error searching for movies: {e}", "danger")
             print(f"Error searching for movies: {e}", file=sys.stderr)
@@ -340,43 +473,77 @@ def now_playing():
     # This route is now a simple HTML renderer for the real-time update page.
     return render_template('now_playing.html', title="Now Playing")
 
+def get_session_poller():
+    """
+    The shared session poller for the logged-in user's Plex server. Only once
+    their own token has connected (through the pool) do they join it.
+    """
+    plex = get_user_plex()
+    if not plex:
+        return None
+    return session_collector.register(users.current_user(), plex)
+
+def _now_playing_version():
+    # Waits here, before the ETag is taken, so a long poll's 304/200 reflects the wait
+    poller = get_session_poller()
+    if not poller:
+        return None
+    since = request.args.get('since', type=int)
+    if since is not None:
+        poller.wait_for_change(since, timeout=app.config['NOW_PLAYING_LONG_POLL_TIMEOUT'])
+    else:
+        poller.wait_ready(timeout=app.config['NOW_PLAYING_LONG_POLL_TIMEOUT'])
+    return None if poller.error else poller.version
+
 @app.route('/api/now_playing_data')
 @login_required
+@http_cache(_now_playing_version)
 def get_now_playing_data():
-    plex = get_user_plex()
-    if not plex:
+    """
+    Latest active sessions from the background collector, without contacting
+    Plex. The snapshot version is sent in X-Snapshot-Version; pass it back as
+    ?since=<version> to wait until the sessions change (long polling, done in
+    _now_playing_version).
+    """
+    poller = get_session_poller()
+    if not poller:
         return jsonify({"error": "Plex server not connected."}), 500
 
-    active_sessions = []
-    try:
-        sessions = plex.sessions()
-        for s in sessions:
-            user_name = s.user.title if s.user else "Unknown User"
-            player_name = s.player.title if s.player else "Unknown Player"
-            content_title = s.title if s.title else "Unknown Content"
-            media_type = s.type if hasattr(s, 'type') else 'N/A'
-
-            view_offset = s.viewOffset / 1000 if hasattr(s, 'viewOffset') else 0
-            duration = s.duration / 1000 if hasattr(s, 'duration') else 0
-
-            progress_percent = 0
-            if duration > 0:
-                progress_percent = (view_offset / duration) * 100
-
-            active_sessions.append({
-                'user': user_name,
-                'player': player_name,
-                'content': content_title,
-                'type': media_type,
-                'progress': f"{progress_percent:.0f}%" if duration > 0 else "N/A",
-                'state': s.state if hasattr(s, 'state') else 'N/A'
-            })
-        
-    except Exception as e:
-        print(f"Error fetching active sessions: {e}", file=sys.stderr)
-        return jsonify({"error": f"Failed to fetch active sessions: {e}"}), 500
+    if poller.error:
+        return jsonify({"error": f"Failed to fetch active sessions: {poller.error}"}), 500
 
-    return jsonify(active_sessions)
+    response = jsonify(poller.snapshot)
+    response.headers['X-Snapshot-Version'] = str(poller.version)
+    return response
+
+@app.route('/api/now_playing/stream')
+@login_required
+def now_playing_stream():
+    """
+    Server-Sent Events feed of active sessions. Every viewer of the same Plex
+    server shares one background poller: a 'snapshot' event is sent on connect,
+    then a 'diff' event with added/updated/removed sessions whenever they change.
+    """
+    poller = get_session_poller()
+    if not poller:
+        return jsonify({"error": "Plex server not connected."}), 500
+    subscriber = poller.subscribe()
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield live_sessions.format_sse(event, data)
+        finally:
+            poller.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # --- D3.js Visualization Routes ---
 
@@ -385,29 +552,25 @@ def get_now_playing_data():
 def genre_distribution_page():
     return render_template('genre_distribution.html', title="Genre Distribution")
 
+def _genre_counts_updated_at():
+    return library.genre_counts_updated_at(users.current_user())
+
 @app.route('/api/genre_distribution_data')
 @login_required
+# The snapshot version changes exactly when a sync changes the counts,
+# so a repeat view is answered with a 304 before any counts are read
+@http_cache(_library_version, max_age=Config.API_CACHE_MAX_AGE, last_modified=_genre_counts_updated_at)
 def get_genre_distribution_data():
-    plex = get_user_plex()
-    if not plex:
-        return jsonify({"error": "Plex server not connected."}), 500
-
-    genre_counts = defaultdict(int)
+    user = users.current_user()
     try:
-        movies = plex.library.section('Movies').all()
-        tv_shows = plex.library.section('TV Shows').all()
-
-        for item in movies + tv_shows:
-            if hasattr(item, 'genres'):
-                for genre in item.genres:
-                    genre_name = genre.tag
-                    genre_counts[genre_name] += 1
+        library.ensure_library(user, get_user_plex)
+        # One grouped read of the per-section counts each sync keeps up to date
+        genre_counts = library.genre_counts(user)
     except Exception as e:
         print(f"Error fetching genre data: {e}", file=sys.stderr)
         return jsonify({"error": f"Failed to fetch genre data: {e}"}), 500
 
-    data = [{"genre": genre, "count": count} for genre, count in genre_counts.items()]
-    data.sort(key=lambda x: x['count'], reverse=True)
+    data = [{"genre": genre, "count": count} for genre, count in genre_counts]
 
     return jsonify(data)
 
@@ -416,37 +579,47 @@ def get_genre_distribution_data():
 def playtime_trends_page():
     return render_template('playtime_trends.html', title="Playtime Trends")
 
+def _history_version():
+    """Watch history watermark, for http_cache; pulls new plays first if due."""
+    user = users.current_user()
+    history.ensure_history(user, get_user_plex)
+    return history.history_version(user)
+
 @app.route('/api/playtime_trends_data')
 @login_required
+@http_cache(_history_version, max_age=Config.API_CACHE_MAX_AGE)
 def get_playtime_trends_data():
-    plex = get_user_plex()
-    if not plex:
-        return jsonify({"error": "Plex server not connected."}), 500
-
-    content_view_counts = defaultdict(int)
+    """
+    Top 20 most played titles, or with ?bucket=day|week their plays per period.
+    ?start= and ?end= (YYYY-MM-DD, inclusive) limit the range; both are optional.
+    """
+    bucket = request.args.get('bucket')
+    if bucket is not None and bucket not in history.BUCKETS:
+        return jsonify({"error": f"bucket must be one of {', '.join(history.BUCKETS)}."}), 400
+    try:
+        start, end = (date.fromisoformat(request.args[name]) if request.args.get(name) else None
+                      for name in ('start', 'end'))
+    except ValueError:
+        return jsonify({"error": "start and end must be dates like 2024-01-31."}), 400
+
+    # New plays were already pulled, if due, by _history_version; the chart itself
+    # is read from the pre-aggregated rollups, not from Plex
+    user = users.current_user()
     try:
-        all_media_items = []
-        sections = plex.library.sections() if plex else []
-        for section in sections:
-            if section.type in ['movie', 'show']:
-                all_media_items.extend(section.all())
-        
-        for item in all_media_items:
-            content_title = getattr(item, 'title', "N/A Content")
-            view_count = getattr(item, 'viewCount', 0)
-
-            if content_title != "N/A Content" and isinstance(view_count, int) and view_count > 0:
-                if item.type == 'episode':
-                    content_title = getattr(item.show(), 'title', "N/A Show Title")
-                
-                content_view_counts[content_title] += view_count
+        if bucket is None:
+            data = [{"show": show, "watch_count": count}
+                    for show, count in history.play_counts(user, start, end, limit=20)]
+        else:
+            series = history.play_series(user, bucket, start, end, limit=20)
+            data = {"bucket": bucket,
+                    "start": start.isoformat() if start else None,
+                    "end": end.isoformat() if end else None,
+                    "series": [{"show": show,
+                                "points": [{"period": period.isoformat(), "watch_count": count}
+                                           for period, count in points]}
+                               for show, points in series.items()]}
     except Exception as e:
         print(f"Error fetching playtime data: {e}", file=sys.stderr)
         return jsonify({"error": f"Failed to fetch playtime data: {e}"}), 500
 
-    data = [{"show": show, "watch_count": count}
-            for show, count in content_view_counts.items()]
-    data.sort(key=lambda x: x['watch_count'], reverse=True)
-    data = data[:20]
-
     return jsonify(data)
@@ -0,0 +1,90 @@
+import re
+import sqlalchemy as sa
+from app import db, library
+from app.models import UserPlexLibrary, UserMediaMetadata
+
+# SQLite FTS5 table over the library snapshot; its rowid is the UserMediaMetadata id.
+# Created by migration on SQLite only, together with a trigger that drops a row's
+# entry when it's deleted (bulk deletes included). Other databases fall back to LIKE.
+FTS_TABLE = 'media_search'
+
+# bm25 column weights: title, summary, genres, actors, year
+RANK = f"bm25({FTS_TABLE}, 10.0, 1.0, 3.0, 4.0, 2.0)"
+
+
+def fts_enabled(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def _document(media):
+    return {
+        'rowid': media.id,
+        'title': media.title,
+        'summary': media.description or '',
+        'genres': ' '.join(media.genre_tags),
+        'actors': media.actors or '',
+        'year': str(media.year or ''),
+    }
+
+
+def index_media(connection, media):
+    if not fts_enabled(connection):
+        return
+    connection.execute(sa.text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"),
+                       {'rowid': media.id})
+    connection.execute(sa.text(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, summary, genres, actors, year) "
+        "VALUES (:rowid, :title, :summary, :genres, :actors, :year)"), _document(media))
+
+
+# Keep the index in step with the snapshot: every row a sync inserts or changes is
+# reindexed in the same transaction, so a refresh only touches what changed.
+# Genre changes count too, since _apply_item() bumps last_updated_at with them.
+@sa.event.listens_for(UserMediaMetadata, 'after_insert')
+@sa.event.listens_for(UserMediaMetadata, 'after_update')
+def _reindex(mapper, connection, media):
+    index_media(connection, media)
+
+
+def match_query(term):
+    """
+    Turns free text into an FTS5 query: every word must match, and the last one
+    may be a prefix, so 'star wa' finds 'Star Wars' while the user is typing.
+    """
+    words = re.findall(r'\w+', term.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return ' '.join(terms)
+
+
+def search(user, term, limit=50):
+    """
+    Ranked movies and shows from the user's snapshot matching `term`, as rows of
+    (id, media_type, title, year, description); just the columns the search page
+    shows, read in the same query as the ranking.
+    """
+    query = match_query(term)
+    if query is None:
+        return []
+    if not fts_enabled(db.session.connection()):
+        return _like_search(user, term, limit)
+    return db.session.execute(sa.text(
+        "SELECT m.id, m.media_type, m.title, m.year, m.description "
+        f"FROM {FTS_TABLE} "
+        f"JOIN user_media_metadata m ON m.id = {FTS_TABLE}.rowid "
+        "JOIN user_plex_library l ON l.id = m.library_id "
+        f"WHERE {FTS_TABLE} MATCH :query AND l.user_id = :user_id AND l.plex_server_url = :server "
+        f"ORDER BY {RANK} LIMIT :limit"),
+        {'query': query, 'user_id': user.id, 'server': user.plex_baseurl, 'limit': limit}).all()
+
+
+def _like_search(user, term, limit):
+    pattern = f"%{term.strip().lower()}%"
+    return db.session.execute(
+        sa.select(UserMediaMetadata.id, UserMediaMetadata.media_type, UserMediaMetadata.title,
+                  UserMediaMetadata.year, UserMediaMetadata.description)
+        .join(UserPlexLibrary).where(*library.snapshot_filter(user))
+        .where(UserMediaMetadata.sort_title.like(pattern))
+        .order_by(UserMediaMetadata.sort_title)
+        .limit(limit)).all()
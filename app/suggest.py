@@ -0,0 +1,98 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from app.catalog import get_catalog
+
+# Recent prefixes whose match range and top results each TitleIndex remembers
+PREFIX_CACHE_SIZE = 256
+
+
+def normalize(text):
+    """Lower-cased, accent-free, single-spaced, so 'Amélie' is found by 'ame'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+class TitleIndex:
+    """
+    Typeahead over one user's snapshot titles.
+
+    Every word start of every title ('star wars', 'wars') is a key in one sorted
+    list, so the titles matching a prefix are the contiguous slice found with two
+    bisects. Recent prefixes keep their slice in an LRU, and a longer prefix
+    ('star w' after 'star') is bisected only within the shorter one's slice.
+    """
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        # Most watched first, so an item's position is its popularity rank
+        self.items = sorted(catalog.records, key=lambda record: (-record.view_count,
+                                                                 (record.title or '').lower()))
+        total = len(self.items)
+        entries = []
+        for position, item in enumerate(self.items):
+            words = normalize(item.title).split(' ')
+            for start in range(len(words)):
+                # Rank: matches at the start of the title before matches later in it,
+                # then by popularity; one int, so picking the top k needs no key function
+                entries.append((' '.join(words[start:]), position if start == 0 else total + position))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ranks = array('q', (rank for _, rank in entries))
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, prefix):
+        """(lo, hi, results) for the prefix; results maps k -> top k, filled in by suggest()."""
+        with self._lock:
+            cached = self._prefixes.get(prefix)
+            if cached is not None:
+                self._prefixes.move_to_end(prefix)
+                return cached
+            # Narrow from the longest cached prefix of this one, if there is one
+            lo, hi = 0, len(self.keys)
+            for end in range(len(prefix) - 1, 0, -1):
+                shorter = self._prefixes.get(prefix[:end])
+                if shorter is not None:
+                    lo, hi, _ = shorter
+                    break
+        lo = bisect.bisect_left(self.keys, prefix, lo, hi)
+        hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo, hi)
+        cached = (lo, hi, {})
+        with self._lock:
+            self._prefixes[prefix] = cached
+            if len(self._prefixes) > PREFIX_CACHE_SIZE:
+                self._prefixes.popitem(last=False)
+        return cached
+
+    def suggest(self, prefix, k=10):
+        """
+        Up to k catalog records with a word in their title starting
+        with `prefix`: titles that start with it first, then the most watched.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        lo, hi, results = self._lookup(prefix)
+        if k not in results:
+            total = len(self.items)
+            # A title can match at several of its word starts; widen until k distinct titles
+            wanted = k
+            while True:
+                ranks = heapq.nsmallest(wanted, self.ranks[lo:hi])
+                top = list(dict.fromkeys(rank % total for rank in ranks))[:k]
+                if len(top) == k or len(ranks) < wanted:
+                    break
+                wanted *= 2
+            results[k] = [self.items[position] for position in top]
+        return results[k]
+
+
+def get_title_index(user):
+    """The user's TitleIndex, rebuilt only when a sync has changed their snapshot."""
+    return get_catalog(user).derived('titles', TitleIndex)
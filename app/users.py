@@ -0,0 +1,75 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import g, session
+from app import app, db
+from app.cache import TTLCache
+from app.models import User
+
+# Detached copies of recently seen users, and the user count. Always in-process:
+# they hold password hashes and Plex tokens, which don't belong in a shared cache file
+_users = TTLCache(ttl=app.config['USER_CACHE_TTL'], namespace='users')
+_counts = TTLCache(ttl=app.config['USER_CACHE_TTL'], max_size=1, namespace='user_count')
+
+_COLUMNS = [column.key for column in sa.inspect(User).column_attrs]
+
+
+def _detached_copy(user):
+    copy = User(**{name: getattr(user, name) for name in _COLUMNS})
+    so.make_transient_to_detached(copy)
+    return copy
+
+
+def load_user(user_id):
+    """
+    The User with this id, attached to the current session. A recently cached
+    copy is merged in with load=False, which issues no SQL; otherwise it's
+    read from the database and cached for USER_CACHE_TTL seconds.
+    """
+    cached = _users.get(user_id)
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        _users.set(user_id, _detached_copy(user))
+    return user
+
+
+def current_user():
+    """The logged-in User, resolved once per request and kept on flask.g."""
+    if 'user' not in g:
+        user_id = session.get('user_id')
+        g.user = load_user(user_id) if user_id is not None else None
+    return g.user
+
+
+def user_count():
+    count = _counts.get('all')
+    if count is None:
+        count = db.session.scalar(sa.select(sa.func.count()).select_from(User))
+        _counts.set('all', count)
+    return count
+
+
+# Cached copies are dropped when a change to the user is committed, not when it's
+# flushed, so a concurrent request can't re-cache the old row in between
+@sa.event.listens_for(User, 'after_insert')
+@sa.event.listens_for(User, 'after_update')
+@sa.event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    session = so.object_session(user)
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(user.id)
+
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def _forget_changed_users(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        for user_id in changed:
+            _users.invalidate(user_id)
+        _counts.clear()
+
+
+@sa.event.listens_for(so.Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_users', None)
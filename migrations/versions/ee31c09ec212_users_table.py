@@ -32,14 +32,15 @@ def upgrade():
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
-    with op.batch_alter_table('user', schema=None) as batch_op:
+    # Recreated rather than altered: SQLite can't ADD COLUMN a NOT NULL column without a default
+    with op.batch_alter_table('user', schema=None, recreate='always') as batch_op:
         batch_op.add_column(sa.Column('email', sa.VARCHAR(length=120), nullable=False))
         batch_op.create_index(batch_op.f('ix_user_email'), ['email'], unique=1)
 
     op.create_table('post',
     sa.Column('id', sa.INTEGER(), nullable=False),
     sa.Column('body', sa.VARCHAR(length=140), nullable=False),
-    sa.Column('timestamp', sa.DATETIME(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
     sa.Column('user_id', sa.INTEGER(), nullable=False),
     sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
     sa.PrimaryKeyConstraint('id')
@@ -0,0 +1,15 @@
+"""
+Runs the background jobs (library syncs and watch history ingestion) in their
+own process instead of inside the web app:
+
+    SCHEDULER_MODE=worker flask run
+    python worker.py
+"""
+from app import app
+from app.jobs import Scheduler, default_jobs
+
+if __name__ == '__main__':
+    # The in-memory caches live in the web processes, which warm their own
+    Scheduler(default_jobs(), workers=app.config['SCHEDULER_WORKERS'],
+              per_server_limit=app.config['SCHEDULER_PER_SERVER_LIMIT'],
+              jitter=app.config['SCHEDULER_JITTER']).run_forever()